@@ -3,17 +3,21 @@ Dependency injection for database and vector store connections.
 """
 
 import os
+import threading
 import duckdb
 import chromadb
 from chromadb.config import Settings
 from typing import Optional
 import logging
+from app.services.db_bulk import create_hot_views
 
 logger = logging.getLogger(__name__)
 
 # Global connections
 _database_connection: Optional[duckdb.DuckDBPyConnection] = None
 _vector_store_client: Optional[chromadb.ClientAPI] = None
+# Each thread's cursor on the shared connection
+_thread_cursors = threading.local()
 
 def get_database() -> duckdb.DuckDBPyConnection:
     """
@@ -40,6 +44,29 @@ def get_database() -> duckdb.DuckDBPyConnection:
     
     return _database_connection
 
+def get_cursor() -> duckdb.DuckDBPyConnection:
+    """
+    Get the calling thread's cursor on the shared DuckDB connection.
+    
+    A DuckDBPyConnection must not be used from several threads at once;
+    cursors share its database instance (catalog and buffer pool) but each
+    runs its own queries and transactions. Request handlers and background
+    tasks run on different threads, so they should query through this.
+    
+    Returns
+    -------
+    duckdb.DuckDBPyConnection
+        Cursor owned by the current thread.
+    """
+    connection = get_database()
+    
+    # A cursor made before close_connections() belongs to the old connection
+    if getattr(_thread_cursors, 'connection', None) is not connection:
+        _thread_cursors.connection = connection
+        _thread_cursors.cursor = connection.cursor()
+    
+    return _thread_cursors.cursor
+
 def get_vector_store() -> chromadb.ClientAPI:
     """
     Get or create Chroma vector store client.
@@ -84,7 +111,7 @@ def _initialize_database_schema(conn: duckdb.DuckDBPyConnection) -> None:
         CREATE TABLE IF NOT EXISTS clinvar_variants (
             rsID VARCHAR PRIMARY KEY,
             chromosome VARCHAR,
-            position BIGINT,
+            position UINTEGER,
             reference_allele VARCHAR,
             alternate_allele VARCHAR,
             clinical_significance VARCHAR,
@@ -103,7 +130,7 @@ def _initialize_database_schema(conn: duckdb.DuckDBPyConnection) -> None:
         CREATE TABLE IF NOT EXISTS gnomad_frequencies (
             rsID VARCHAR PRIMARY KEY,
             chromosome VARCHAR,
-            position BIGINT,
+            position UINTEGER,
             reference_allele VARCHAR,
             alternate_allele VARCHAR,
             allele_frequency DOUBLE,
@@ -134,7 +161,7 @@ def _initialize_database_schema(conn: duckdb.DuckDBPyConnection) -> None:
             upload_id VARCHAR,
             rsID VARCHAR,
             chromosome VARCHAR,
-            position BIGINT,
+            position UINTEGER,
             genotype VARCHAR,
             classification VARCHAR,
             confidence_score DOUBLE,
@@ -182,13 +209,16 @@ def _initialize_database_schema(conn: duckdb.DuckDBPyConnection) -> None:
         )
     """)
     
-    # Create indexes for better performance
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_clinvar_rsid ON clinvar_variants(rsID)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_gnomad_rsid ON gnomad_frequencies(rsID)")
+    # Create indexes for better performance; rsID lookups already use the primary key
+    conn.execute("DROP INDEX IF EXISTS idx_clinvar_rsid")
+    conn.execute("DROP INDEX IF EXISTS idx_gnomad_rsid")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_variant_analyses_upload ON variant_analyses(upload_id)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_upload ON reports(upload_id)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages(session_id)")
     
+    # Narrow ClinVar/gnomAD views read when annotating uploads
+    create_hot_views(conn)
+    
     logger.info("Database schema initialized successfully")
 
 def close_connections():
@@ -2,7 +2,7 @@
 Main FastAPI application for Genomic-LLM.
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import os
@@ -11,6 +11,8 @@ from contextlib import asynccontextmanager
 
 from app.routers import genome_upload, report, chat
 from app.dependencies import get_database, get_vector_store
+from app.services.rag_engine import close_http_client, start_request_cache, reset_request_cache
+from app.services.report_generator import warm_report_templates
 
 # Configure logging
 logging.basicConfig(
@@ -28,6 +30,7 @@ async def lifespan(app: FastAPI):
     try:
         database = get_database()
         vector_store = get_vector_store()
+        warm_report_templates()
         logger.info("Database and vector store initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize services: {e}")
@@ -36,6 +39,7 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("Shutting down Genomic-LLM API...")
+    await close_http_client()
 
 app = FastAPI(
     title="Genomic-LLM API",
@@ -55,6 +59,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def rag_request_cache(request: Request, call_next):
+    """Give each request its own RAG cache, discarded when it completes."""
+    token = start_request_cache()
+    try:
+        return await call_next(request)
+    finally:
+        reset_request_cache(token)
+
 # Include routers
 app.include_router(genome_upload.router, prefix="/api/v1", tags=["genome"])
 app.include_router(report.router, prefix="/api/v1", tags=["reports"])
@@ -10,7 +10,7 @@ import logging
 
 from app.models.schemas import ChatRequest, ChatResponse, ChatSession, ChatMessage, MessageType
 from app.services.rag_engine import query_knowledge_base, get_relevant_context
-from app.dependencies import get_database, get_vector_store
+from app.dependencies import get_cursor, get_vector_store
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +37,7 @@ async def chat_with_analysis(request: ChatRequest):
         session_id = request.session_id
         
         # Verify upload exists
-        db = get_database()
+        db = get_cursor()
         upload_result = db.execute("""
             SELECT filename, processing_status
             FROM user_uploads 
@@ -146,7 +146,7 @@ async def get_chat_history(session_id: str):
         Chat history.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         # Verify session exists
         session_result = db.execute("""
@@ -210,7 +210,7 @@ async def list_chat_sessions(upload_id: Optional[str] = None):
         List of chat sessions.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         if upload_id:
             query = """
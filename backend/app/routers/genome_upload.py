@@ -19,13 +19,17 @@ from app.models.schemas import (
 from app.services.format_detector import validate_genomic_file
 from app.services.variant_parser import parse_23andme_txt, convert_to_standard_format
 from app.services.acmg_classifier import classify_variant, get_acmg_criteria_details, generate_clinical_interpretation
-from app.services.clinvar_lookup import batch_lookup_clinvar_variants, batch_lookup_gnomad_frequencies
-from app.dependencies import get_database
+from app.services.clinvar_lookup import lookup_clinvar_and_gnomad
+from app.dependencies import get_cursor
+from app.services.db_bulk import bulk_insert_variants
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Classified variant rows buffered before each bulk insert
+VARIANT_FLUSH_ROWS = 10_000
+
 # In-memory storage for upload status (in production, use Redis or database)
 upload_status_store: Dict[str, Dict[str, Any]] = {}
 
@@ -88,7 +92,7 @@ async def upload_genome_file(
             )
         
         # Store upload information in database
-        db = get_database()
+        db = get_cursor()
         db.execute("""
             INSERT INTO uploads (id, filename, file_path, file_size, user_id)
             VALUES (?, ?, ?, ?, ?)
@@ -175,7 +179,7 @@ async def get_analysis_results(upload_id: str):
             )
         
         # Retrieve analysis results from database
-        db = get_database()
+        db = get_cursor()
         
         # First get the analysis ID for this upload
         analysis_result = db.execute("""
@@ -318,22 +322,15 @@ async def process_genome_file(upload_id: str, file_path: str):
         # Batch lookup ClinVar and gnomAD information
         rsids = [v['rsID'] for v in standardized_variants]
         upload_status_store[upload_id].update({
-            'message': 'Looking up ClinVar annotations...',
+            'message': 'Looking up ClinVar annotations and gnomAD frequencies...',
             'progress': 30.0
         })
         
-        clinvar_data = batch_lookup_clinvar_variants(rsids)
-        
-        upload_status_store[upload_id].update({
-            'message': 'Looking up gnomAD frequencies...',
-            'progress': 35.0
-        })
-        
-        gnomad_data = batch_lookup_gnomad_frequencies(rsids)
+        clinvar_data, gnomad_data = await lookup_clinvar_and_gnomad(rsids)
         
         # Create analysis record
         analysis_id = str(uuid.uuid4())
-        db = get_database()
+        db = get_cursor()
         db.execute("""
             INSERT INTO analyses (id, upload_id, total_variants, status)
             VALUES (?, ?, ?, ?)
@@ -342,6 +339,9 @@ async def process_genome_file(upload_id: str, file_path: str):
         # Process variants in batches
         batch_size = 100
         processed_count = 0
+        # Results are written in chunks of VARIANT_FLUSH_ROWS instead of one INSERT
+        # per variant, so memory stays bounded and finished rows become visible
+        variant_rows = []
         
         upload_status_store[upload_id].update({
             'message': 'Classifying variants...',
@@ -379,19 +379,20 @@ async def process_genome_file(upload_id: str, file_path: str):
                     gene_symbol = clinvar_info.get('gene_symbol') if clinvar_info else None
                     clinical_significance = clinvar_info.get('clinical_significance') if clinvar_info else None
                     
-                    db.execute("""
-                        INSERT INTO variant_results (
-                            id, analysis_id, rsid, chromosome, position,
-                            genotype, acmg_classification, confidence_score,
-                            interpretation, gnomad_frequency, gene_symbol,
-                            clinical_significance
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, [
-                        variant_id, analysis_id, rsid, variant['chromosome'],
-                        variant['position'], variant['genotype'], classification,
-                        confidence_score, interpretation, gnomad_freq, gene_symbol,
-                        clinical_significance
-                    ])
+                    variant_rows.append({
+                        'id': variant_id,
+                        'analysis_id': analysis_id,
+                        'rsid': rsid,
+                        'chromosome': variant['chromosome'],
+                        'position': variant['position'],
+                        'genotype': variant['genotype'],
+                        'acmg_classification': classification,
+                        'confidence_score': confidence_score,
+                        'interpretation': interpretation,
+                        'gnomad_frequency': gnomad_freq,
+                        'gene_symbol': gene_symbol,
+                        'clinical_significance': clinical_significance
+                    })
                     
                     processed_count += 1
                     
@@ -400,6 +401,10 @@ async def process_genome_file(upload_id: str, file_path: str):
                     upload_status_store[upload_id]['errors'].append(f"Variant {variant.get('rsID')}: {str(e)}")
                     continue
             
+            if len(variant_rows) >= VARIANT_FLUSH_ROWS:
+                processed_count -= await flush_variant_rows(upload_id, variant_rows)
+                variant_rows.clear()
+            
             # Update progress
             progress = 40.0 + (processed_count / total_variants) * 50.0
             upload_status_store[upload_id].update({
@@ -408,6 +413,9 @@ async def process_genome_file(upload_id: str, file_path: str):
                 'message': f'Processed {processed_count}/{total_variants} variants...'
             })
         
+        if variant_rows:
+            processed_count -= await flush_variant_rows(upload_id, variant_rows)
+        
         # Update analysis and upload status to completed
         processing_time = (datetime.now() - start_time).total_seconds()
         
@@ -442,7 +450,7 @@ async def process_genome_file(upload_id: str, file_path: str):
         
         # Update database status
         try:
-            db = get_database()
+            db = get_cursor()
             db.execute("""
                 UPDATE uploads 
                 SET status = ?
@@ -451,6 +459,40 @@ async def process_genome_file(upload_id: str, file_path: str):
         except Exception as db_error:
             logger.error(f"Failed to update database status: {db_error}")
 
+def _insert_variant_rows(variant_rows: List[Dict[str, Any]]) -> int:
+    """Insert variant_results rows on the calling thread's cursor."""
+    return bulk_insert_variants(get_cursor(), variant_rows)
+
+async def flush_variant_rows(upload_id: str, variant_rows: List[Dict[str, Any]]) -> int:
+    """
+    Write buffered variant results without blocking the event loop.
+    
+    bulk_insert_variants rolls the batch back if any row fails, so a failed
+    flush loses only that batch; the error is recorded on the upload and
+    processing continues with the next one.
+    
+    Parameters
+    ----------
+    upload_id : str
+        Upload ID.
+    variant_rows : list
+        Rows keyed by variant_results column name.
+        
+    Returns
+    -------
+    int
+        Number of rows that could not be stored.
+    """
+    try:
+        await asyncio.to_thread(_insert_variant_rows, variant_rows)
+        return 0
+    except Exception as e:
+        logger.error(f"Error storing {len(variant_rows)} variant results for upload {upload_id}: {e}")
+        upload_status_store[upload_id]['errors'].append(
+            f"Failed to store {len(variant_rows)} variant results: {str(e)}"
+        )
+        return len(variant_rows)
+
 def calculate_confidence_score(criteria: Dict[str, Any]) -> float:
     """
     Calculate confidence score based on ACMG criteria.
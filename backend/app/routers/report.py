@@ -11,8 +11,8 @@ from fastapi.responses import FileResponse
 import logging
 
 from app.models.schemas import ReportRequest, ReportResponse, ReportLanguage
-from app.services.report_generator import generate_pdf_report, generate_markdown_report
-from app.dependencies import get_database
+from app.services.report_generator import generate_pdf_from_html_async, generate_html_report, generate_markdown_report
+from app.dependencies import get_cursor
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +38,7 @@ async def generate_report(request: ReportRequest):
         language = request.language
         
         # Verify upload exists and is completed
-        db = get_database()
+        db = get_cursor()
         
         upload_result = db.execute("""
             SELECT filename, processing_status, upload_timestamp
@@ -122,7 +122,8 @@ async def generate_report(request: ReportRequest):
         pdf_filename = f"report_{upload_id}_{language}_{report_id}.pdf"
         pdf_path = os.path.join(reports_dir, pdf_filename)
         
-        pdf_success = generate_pdf_report(markdown_content, pdf_path, language)
+        # Render the PDF from HTML directly rather than converting the markdown
+        pdf_success = await generate_pdf_from_html_async(generate_html_report(report_data), pdf_path)
         
         if not pdf_success:
             raise HTTPException(status_code=500, detail="Failed to generate PDF report")
@@ -177,7 +178,7 @@ async def download_report(report_id: str):
         PDF file download.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         result = db.execute("""
             SELECT pdf_path, upload_id, language
@@ -224,7 +225,7 @@ async def get_report_pdf(report_id: str):
         PDF file for viewing.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         result = db.execute("""
             SELECT pdf_path
@@ -267,7 +268,7 @@ async def get_report_markdown(report_id: str):
         Markdown content.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         result = db.execute("""
             SELECT markdown_content, upload_id, language, generated_at
@@ -318,7 +319,7 @@ async def list_reports(
         List of reports.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         # Build query with filters
         query = """
@@ -384,7 +385,7 @@ async def delete_report(report_id: str):
         Deletion confirmation.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         # Get report info
         result = db.execute("""
@@ -2,12 +2,30 @@
 ClinVar lookup service for variant annotation.
 """
 
-from typing import Dict, Any, Optional, List
+import asyncio
+from typing import Dict, Any, Optional, List, Tuple
 import logging
-from app.dependencies import get_database
+import pyarrow as pa
+from app.dependencies import get_cursor, get_database
+from app.services.db_bulk import bulk_lookup
 
 logger = logging.getLogger(__name__)
 
+def _arrow_lookup(
+    table: str,
+    hot_table: str,
+    columns: Tuple[str, ...],
+    rsids: List[str],
+    hot: bool
+) -> pa.Table:
+    """Batch rsID lookup behind the ClinVar and gnomAD *_arrow functions."""
+    # A dedicated cursor keeps the lookup safe to run from a worker thread
+    with get_database().cursor() as cursor:
+        if hot:
+            # Narrow view (app.services.db_bulk.HOT_VIEWS)
+            return bulk_lookup(cursor, hot_table, rsids)
+        return bulk_lookup(cursor, table, rsids, columns)
+
 def lookup_clinvar_variant(rsid: str) -> Optional[Dict[str, Any]]:
     """
     Look up variant information in ClinVar database.
@@ -23,7 +41,7 @@ def lookup_clinvar_variant(rsid: str) -> Optional[Dict[str, Any]]:
         ClinVar variant information if found.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         query = """
         SELECT 
@@ -64,7 +82,31 @@ def lookup_clinvar_variant(rsid: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error looking up ClinVar variant {rsid}: {e}")
         return None
 
-def batch_lookup_clinvar_variants(rsids: List[str]) -> Dict[str, Dict[str, Any]]:
+def batch_lookup_clinvar_variants_arrow(
+    rsids: List[str],
+    hot: bool = False
+) -> pa.Table:
+    """
+    Batch lookup of multiple variants in ClinVar as an Arrow table.
+    
+    Parameters
+    ----------
+    rsids : list
+        List of rsIDs to lookup.
+    hot : bool
+        Read only the columns variant classification needs, from clinvar_hot.
+        
+    Returns
+    -------
+    pa.Table
+        Columnar ClinVar variant information, one row per rsID found.
+    """
+    return _arrow_lookup('clinvar_variants', 'clinvar_hot', _CLINVAR_COLUMNS, rsids, hot)
+
+def batch_lookup_clinvar_variants(
+    rsids: List[str],
+    hot: bool = False
+) -> Dict[str, Dict[str, Any]]:
     """
     Batch lookup of multiple variants in ClinVar.
     
@@ -72,49 +114,22 @@ def batch_lookup_clinvar_variants(rsids: List[str]) -> Dict[str, Dict[str, Any]]
     ----------
     rsids : list
         List of rsIDs to lookup.
+    hot : bool
+        Read only the columns variant classification needs, from clinvar_hot.
         
     Returns
     -------
     dict
         Dictionary mapping rsID to variant information.
     """
+    if not rsids:
+        return {}
+    
     try:
-        db = get_database()
-        
-        # Create placeholders for IN clause
-        placeholders = ','.join(['?'] * len(rsids))
-        
-        query = f"""
-        SELECT 
-            rsID,
-            chromosome,
-            position,
-            reference_allele,
-            alternate_allele,
-            clinical_significance,
-            review_status,
-            phenotype,
-            gene_symbol,
-            hgvs_c,
-            hgvs_p,
-            molecular_consequence
-        FROM clinvar_variants 
-        WHERE rsID IN ({placeholders})
-        """
-        
-        results = db.execute(query, rsids).fetchall()
+        table = batch_lookup_clinvar_variants_arrow(rsids, hot)
         
         # Convert to dictionary
-        variants = {}
-        columns = [
-            'rsID', 'chromosome', 'position', 'reference_allele',
-            'alternate_allele', 'clinical_significance', 'review_status',
-            'phenotype', 'gene_symbol', 'hgvs_c', 'hgvs_p', 'molecular_consequence'
-        ]
-        
-        for result in results:
-            variant_info = {col: result[i] for i, col in enumerate(columns)}
-            variants[variant_info['rsID']] = variant_info
+        variants = {row['rsID']: row for row in table.to_pylist()}
         
         logger.info(f"Found {len(variants)} ClinVar variants out of {len(rsids)} requested")
         return variants
@@ -133,7 +148,7 @@ def get_clinvar_statistics() -> Dict[str, Any]:
         Database statistics.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         stats = {}
         
@@ -182,6 +197,32 @@ def get_clinvar_statistics() -> Dict[str, Any]:
         logger.error(f"Error getting ClinVar statistics: {e}")
         return {'error': str(e)}
 
+_CLINVAR_COLUMNS = (
+    'rsID', 'chromosome', 'position', 'reference_allele',
+    'alternate_allele', 'clinical_significance', 'review_status',
+    'phenotype', 'gene_symbol', 'hgvs_c', 'hgvs_p', 'molecular_consequence'
+)
+
+_SEARCH_BY_GENE_QUERY = """
+SELECT 
+    rsID,
+    chromosome,
+    position,
+    reference_allele,
+    alternate_allele,
+    clinical_significance,
+    review_status,
+    phenotype,
+    gene_symbol,
+    hgvs_c,
+    hgvs_p,
+    molecular_consequence
+FROM clinvar_variants 
+WHERE gene_symbol = ?
+ORDER BY position
+LIMIT ?
+"""
+
 def search_clinvar_by_gene(gene_symbol: str, limit: int = 100) -> List[Dict[str, Any]]:
     """
     Search ClinVar variants by gene symbol.
@@ -199,41 +240,12 @@ def search_clinvar_by_gene(gene_symbol: str, limit: int = 100) -> List[Dict[str,
         List of variant information.
     """
     try:
-        db = get_database()
-        
-        query = """
-        SELECT 
-            rsID,
-            chromosome,
-            position,
-            reference_allele,
-            alternate_allele,
-            clinical_significance,
-            review_status,
-            phenotype,
-            gene_symbol,
-            hgvs_c,
-            hgvs_p,
-            molecular_consequence
-        FROM clinvar_variants 
-        WHERE gene_symbol = ?
-        ORDER BY position
-        LIMIT ?
-        """
+        db = get_cursor()
         
-        results = db.execute(query, [gene_symbol, limit]).fetchall()
+        results = db.execute(_SEARCH_BY_GENE_QUERY, [gene_symbol, limit]).fetchall()
         
         # Convert to list of dictionaries
-        variants = []
-        columns = [
-            'rsID', 'chromosome', 'position', 'reference_allele',
-            'alternate_allele', 'clinical_significance', 'review_status',
-            'phenotype', 'gene_symbol', 'hgvs_c', 'hgvs_p', 'molecular_consequence'
-        ]
-        
-        for result in results:
-            variant_info = {col: result[i] for i, col in enumerate(columns)}
-            variants.append(variant_info)
+        variants = [dict(zip(_CLINVAR_COLUMNS, result)) for result in results]
         
         logger.info(f"Found {len(variants)} ClinVar variants for gene {gene_symbol}")
         return variants
@@ -257,8 +269,11 @@ def get_pathogenic_variants(limit: int = 1000) -> List[Dict[str, Any]]:
         List of pathogenic variants.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
+        # DuckDB plans ORDER BY ... LIMIT as a bounded top-N heap rather than
+        # a full sort, and its ART indexes cannot serve ordered scans, so an
+        # index on the sort keys would only slow down ClinVar ingestion.
         query = """
         SELECT 
             rsID,
@@ -308,6 +323,12 @@ def get_pathogenic_variants(limit: int = 1000) -> List[Dict[str, Any]]:
         return []
 
 # gnomAD lookup functions
+_GNOMAD_BATCH_COLUMNS = (
+    'rsid', 'chromosome', 'position', 'reference_allele', 'alternate_allele',
+    'allele_frequency', 'allele_count', 'allele_number', 'homozygote_count',
+    'af_afr', 'af_ami', 'af_amr', 'af_asj', 'af_eas', 'af_fin', 'af_nfe', 'af_oth', 'af_sas'
+)
+
 def lookup_gnomad_frequency(rsid: str) -> Optional[Dict[str, Any]]:
     """
     Look up variant frequency information in gnomAD database.
@@ -323,7 +344,7 @@ def lookup_gnomad_frequency(rsid: str) -> Optional[Dict[str, Any]]:
         gnomAD frequency information if found.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         query = """
         SELECT 
@@ -362,7 +383,31 @@ def lookup_gnomad_frequency(rsid: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error looking up gnomAD frequency {rsid}: {e}")
         return None
 
-def batch_lookup_gnomad_frequencies(rsids: List[str]) -> Dict[str, Dict[str, Any]]:
+def batch_lookup_gnomad_frequencies_arrow(
+    rsids: List[str],
+    hot: bool = False
+) -> pa.Table:
+    """
+    Batch lookup of multiple variants in gnomAD as an Arrow table.
+    
+    Parameters
+    ----------
+    rsids : list
+        List of rsIDs to lookup.
+    hot : bool
+        Read only the columns variant classification needs, from gnomad_hot.
+        
+    Returns
+    -------
+    pa.Table
+        Columnar frequency information, one row per rsID found.
+    """
+    return _arrow_lookup('gnomad_frequencies', 'gnomad_hot', _GNOMAD_BATCH_COLUMNS, rsids, hot)
+
+def batch_lookup_gnomad_frequencies(
+    rsids: List[str],
+    hot: bool = False
+) -> Dict[str, Dict[str, Any]]:
     """
     Batch lookup of multiple variants in gnomAD.
     
@@ -370,47 +415,22 @@ def batch_lookup_gnomad_frequencies(rsids: List[str]) -> Dict[str, Dict[str, Any
     ----------
     rsids : list
         List of rsIDs to lookup.
+    hot : bool
+        Read only the columns variant classification needs, from gnomad_hot.
         
     Returns
     -------
     dict
         Dictionary mapping rsID to frequency information.
     """
+    if not rsids:
+        return {}
+    
     try:
-        db = get_database()
-        
-        # Create placeholders for IN clause
-        placeholders = ','.join(['?'] * len(rsids))
-        
-        query = f"""
-        SELECT 
-            rsid,
-            chromosome,
-            position,
-            reference_allele,
-            alternate_allele,
-            allele_frequency,
-            allele_count,
-            allele_number,
-            homozygote_count,
-            population_frequencies
-        FROM gnomad_frequencies 
-        WHERE rsid IN ({placeholders})
-        """
-        
-        results = db.execute(query, rsids).fetchall()
+        table = batch_lookup_gnomad_frequencies_arrow(rsids, hot)
         
         # Convert to dictionary
-        frequencies = {}
-        columns = [
-            'rsid', 'chromosome', 'position', 'reference_allele',
-            'alternate_allele', 'allele_frequency', 'allele_count',
-            'allele_number', 'homozygote_count', 'population_frequencies'
-        ]
-        
-        for result in results:
-            freq_info = {col: result[i] for i, col in enumerate(columns)}
-            frequencies[freq_info['rsid']] = freq_info
+        frequencies = {row['rsid']: row for row in table.to_pylist()}
         
         logger.info(f"Found {len(frequencies)} gnomAD frequencies out of {len(rsids)} requested")
         return frequencies
@@ -419,6 +439,35 @@ def batch_lookup_gnomad_frequencies(rsids: List[str]) -> Dict[str, Dict[str, Any
         logger.error(f"Error in batch gnomAD lookup: {e}")
         return {}
 
+async def lookup_clinvar_and_gnomad(
+    rsids: List[str]
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Look up ClinVar annotations and gnomAD frequencies concurrently.
+    
+    Only the columns variant classification reads are fetched, from the
+    clinvar_hot and gnomad_hot views.
+    
+    The two queries touch disjoint tables, so each runs in a worker thread
+    on its own cursor and their scans overlap without blocking the event
+    loop.
+    
+    Parameters
+    ----------
+    rsids : list
+        List of rsIDs to lookup.
+        
+    Returns
+    -------
+    tuple
+        (clinvar_data, gnomad_data) dictionaries mapping rsID to information.
+    """
+    clinvar_data, gnomad_data = await asyncio.gather(
+        asyncio.to_thread(batch_lookup_clinvar_variants, rsids, hot=True),
+        asyncio.to_thread(batch_lookup_gnomad_frequencies, rsids, hot=True)
+    )
+    return clinvar_data, gnomad_data
+
 def get_rare_variants(max_frequency: float = 0.01, limit: int = 1000) -> List[Dict[str, Any]]:
     """
     Get rare variants from gnomAD (frequency below threshold).
@@ -436,7 +485,7 @@ def get_rare_variants(max_frequency: float = 0.01, limit: int = 1000) -> List[Di
         List of rare variants.
     """
     try:
-        db = get_database()
+        db = get_cursor()
         
         query = """
         SELECT 
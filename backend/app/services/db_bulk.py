@@ -0,0 +1,135 @@
+"""
+Bulk DuckDB reads and writes shared by the API and the ingestion scripts.
+"""
+
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import duckdb
+import pyarrow as pa
+
+# Column types of variant_results filled by bulk_insert_variants; id, analysis_id
+# and rsid are required, the rest may be missing from a row
+VARIANT_RESULT_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('analysis_id', pa.string()),
+    ('rsid', pa.string()),
+    ('chromosome', pa.string()),
+    ('position', pa.uint32()),
+    ('reference_allele', pa.string()),
+    ('alternate_allele', pa.string()),
+    ('genotype', pa.string()),
+    ('acmg_classification', pa.string()),
+    ('acmg_score', pa.float64()),
+    ('confidence_score', pa.float64()),
+    ('clinical_significance', pa.string()),
+    ('gene_symbol', pa.string()),
+    ('consequence', pa.string()),
+    ('clinvar_id', pa.string()),
+    ('gnomad_frequency', pa.float64()),
+    ('interpretation', pa.string()),
+])
+
+def bulk_insert_variants(conn: duckdb.DuckDBPyConnection, rows: Iterable[Dict[str, Any]],
+                         batch_size: int = 10_000) -> int:
+    """
+    Insert variant_results rows as Arrow batches in one transaction.
+    
+    Each batch is written sorted by analysis and position, so an analysis
+    occupies contiguous row groups and zonemaps skip the rest on reads.
+    
+    Parameters
+    ----------
+    conn : duckdb.DuckDBPyConnection
+        Database connection.
+    rows : iterable of dict
+        Rows keyed by variant_results column name.
+    batch_size : int
+        Rows converted and inserted per statement.
+        
+    Returns
+    -------
+    int
+        Number of rows inserted.
+    """
+    columns_str = ', '.join(VARIANT_RESULT_SCHEMA.names)
+    rows = iter(rows)
+    inserted = 0
+    
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            conn.register('variant_results_batch', pa.Table.from_pylist(chunk, schema=VARIANT_RESULT_SCHEMA))
+            try:
+                conn.execute(f"""
+                INSERT INTO variant_results ({columns_str})
+                SELECT {columns_str} FROM variant_results_batch
+                ORDER BY analysis_id, chromosome, position
+                """)
+            finally:
+                conn.unregister('variant_results_batch')
+            inserted += len(chunk)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    return inserted
+
+def bulk_lookup(conn: duckdb.DuckDBPyConnection, table: str, rsids: List[str],
+                columns: Optional[Sequence[str]] = None) -> pa.Table:
+    """
+    Fetch the rows of a table keyed by rsid for many rsIDs in one query.
+    
+    The rsID list is bound as a single parameter and joined against the
+    table, so a whole genome costs one plan instead of one per variant.
+    
+    Parameters
+    ----------
+    conn : duckdb.DuckDBPyConnection
+        Database connection.
+    table : str
+        Table with an rsid column, e.g. clinvar_variants or clinvar_hot.
+    rsids : list
+        rsIDs to look up.
+    columns : sequence of str, optional
+        Columns to return; all columns by default.
+    
+    Returns
+    -------
+    pa.Table
+        One row per rsID found.
+    """
+    columns_str = ', '.join(columns) if columns else '*'
+    return conn.execute(
+        f"SELECT {columns_str} FROM {table} WHERE rsid IN (SELECT UNNEST(?))", [rsids]
+    ).fetch_arrow_table()
+
+# Narrow views of the ClinVar and gnomAD columns variant classification reads
+# (view -> (source table, select list)); DuckDB scans only the projected
+# columns, so annotating an upload never touches the wide condition/HGVS/
+# frequency JSON columns, and a view cannot go stale when the source changes.
+# The rsID column is aliased to the key clinvar_lookup returns, whichever
+# schema created the source
+HOT_VIEWS = {
+    'clinvar_hot': (
+        'clinvar_variants',
+        ['rsid AS rsID', 'clinical_significance', 'review_status', 'gene_symbol', 'molecular_consequence']
+    ),
+    'gnomad_hot': ('gnomad_frequencies', ['rsid AS rsid', 'allele_frequency']),
+}
+
+def create_hot_views(conn: duckdb.DuckDBPyConnection):
+    """Create the HOT_VIEWS, replacing the snapshot tables earlier versions built."""
+    snapshots = {
+        row[0] for row in conn.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE table_name IN (SELECT UNNEST(?))",
+            [list(HOT_VIEWS)]
+        ).fetchall()
+    }
+    for view, (source, columns) in HOT_VIEWS.items():
+        if view in snapshots:
+            conn.execute(f"DROP TABLE {view}")
+        conn.execute(f"CREATE OR REPLACE VIEW {view} AS SELECT {', '.join(columns)} FROM {source}")
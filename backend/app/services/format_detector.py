@@ -4,11 +4,16 @@ File format detector and validator for genomic data.
 
 from typing import Dict, Any, Tuple, Optional
 import os
+import re
 import logging
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Case-insensitive header markers, searched without lowercasing the header
+_RE_23ANDME = re.compile(r'23andme', re.IGNORECASE)
+_RE_RSID = re.compile(r'rsid', re.IGNORECASE)
+
 def detect_file_format(file_path: str) -> Tuple[str, float, Optional[str]]:
     """
     Detect the format of a genomic file.
@@ -85,10 +90,10 @@ def analyze_txt_format(lines: list, file_path: str) -> Tuple[str, float, Optiona
         score_23andme += 0.3
         
         # Check for 23andMe specific headers
-        header_text = ' '.join(header_lines).lower()
-        if '23andme' in header_text:
+        header_text = '\n'.join(header_lines)
+        if _RE_23ANDME.search(header_text):
             score_23andme += 0.4
-        if 'rsid' in header_text:
+        if _RE_RSID.search(header_text):
             score_23andme += 0.2
     
     # Look for data format
@@ -2,14 +2,198 @@
 RAG (Retrieval-Augmented Generation) engine for genomic knowledge.
 """
 
+import asyncio
 import httpx
-from typing import Dict, Any, List, Optional
+from contextvars import ContextVar, Token
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+import hashlib
 import logging
+from itertools import islice
+from operator import itemgetter
+import os
+import re
+import threading
+import numpy as np
+from cachetools import TTLCache
+from diskcache import Cache
 from app.dependencies import get_vector_store
 from app.services.clinvar_lookup import get_pathogenic_variants
+from app.services.semantic_cache import (
+    SemanticCache, context_fingerprint, quantize_int8, dequantize_int8
+)
 
 logger = logging.getLogger(__name__)
 
+LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "http://llm:8001")
+
+# Shared client so embedding calls reuse keep-alive connections to the LLM service
+_HTTP_CLIENT = httpx.AsyncClient(
+    base_url=LLM_SERVICE_URL,
+    timeout=30.0,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+)
+
+# Query embeddings keyed by SHA-256 of the text; entries expire after an
+# hour so a redeployed embedding model is picked up
+_EMBEDDING_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+# The embedding model reads at most 512 tokens and every whitespace-separated
+# word is at least one token, so text past the first 512 words is never seen
+MAX_EMBEDDING_WORDS = 512
+
+# Prompt budget for the combined RAG context
+MAX_CONTEXT_CHARS = 6000
+
+# Embeddings persisted across restarts, opened on first use
+_embedding_disk_cache: Optional[Cache] = None
+# Disk cache reads and writes run in worker threads, which may open it first
+_embedding_disk_cache_lock = threading.Lock()
+
+# Request-scoped memo for RAG work, installed per request by middleware
+_REQUEST_CACHE: ContextVar[Optional[Dict[Any, Any]]] = ContextVar("rag_cache", default=None)
+
+# Chroma collection handles by name, dropped again if a call on one fails
+_COLLECTION_CACHE: Dict[str, Any] = {}
+
+# RAG results reused for near-identical questions about the same analysis
+_SEMANTIC_CACHE = SemanticCache(capacity=256, threshold=0.92)
+
+# Static contexts returned by get_relevant_context
+ACMG_CONTEXT = """
+As diretrizes ACMG-2015 (American College of Medical Genetics) estabelecem critérios padronizados
+para classificação de variantes genéticas em cinco categorias:
+1. Patogênica: Variante que causa doença
+2. Provavelmente Patogênica: Evidência forte de patogenicidade
+3. VUS (Variante de Significado Incerto): Evidência insuficiente
+4. Provavelmente Benigna: Evidência de que não causa doença
+5. Benigna: Variante normal na população
+
+Os critérios incluem evidência populacional, computacional, funcional e segregação familiar.
+"""
+
+LIMITATIONS_23ANDME_CONTEXT = """
+Limitações dos dados 23andMe:
+- Cobertura limitada do genoma (aproximadamente 600.000 variantes)
+- Foco em SNPs comuns, não incluindo indels ou variantes estruturais
+- Não substitui sequenciamento clínico completo
+- Dados podem ter taxa de erro de genotipagem
+- Interpretação requer validação clínica
+"""
+
+GENERAL_CONTEXT = """
+A análise genômica moderna utiliza bancos de dados como ClinVar e gnomAD para interpretar variantes.
+ClinVar fornece classificações clínicas de variantes, enquanto gnomAD oferece frequências populacionais.
+A interpretação deve sempre considerar o contexto clínico e histórico familiar.
+"""
+
+# Keyword routes for get_relevant_context, in priority order
+_CONTEXT_ROUTES = (
+    ('acmg', ('acmg', 'classificação', 'critérios', 'guidelines'), ACMG_CONTEXT),
+    ('23andme', ('23andme', 'limitações', 'limitations'), LIMITATIONS_23ANDME_CONTEXT),
+)
+_CONTEXT_ROUTE_BY_TERM = {term: route for route, terms, _ in _CONTEXT_ROUTES for term in terms}
+
+# One alternation over every term, so the query is scanned once
+_CONTEXT_ROUTE_PATTERN = re.compile(
+    '|'.join(re.escape(term) for term in sorted(_CONTEXT_ROUTE_BY_TERM, key=len, reverse=True))
+)
+
+# rsIDs and gene symbols named in a query; answers about different
+# variants must never share a semantic cache entry
+_QUERY_ENTITY_PATTERN = re.compile(r'\b(?:[Rr][Ss]\d+|[A-Z][A-Z0-9-]{1,9})\b')
+
+# Variant fields read when building contexts, with defaults for missing keys
+_ANALYSIS_VARIANT_FIELDS = (
+    ('rsID', 'desconhecido'),
+    ('classification', 'desconhecida'),
+    ('genotype', 'desconhecido'),
+    ('clinical_interpretation', ''),
+)
+_PATHOGENIC_VARIANT_FIELDS = (
+    ('rsID', 'desconhecido'),
+    ('gene_symbol', 'gene desconhecido'),
+    ('clinical_significance', 'significado desconhecido'),
+    ('phenotype', 'fenótipo não especificado'),
+)
+_CLASSIFIED_VARIANT_FIELDS = (
+    ('rsID', ''),
+    ('classification', ''),
+)
+_VARIANT_GETTERS = {
+    fields: itemgetter(*(key for key, _ in fields))
+    for fields in (_ANALYSIS_VARIANT_FIELDS, _PATHOGENIC_VARIANT_FIELDS, _CLASSIFIED_VARIANT_FIELDS)
+}
+
+def _variant_fields(variant: Dict[str, Any], fields: Tuple[Tuple[str, Any], ...]) -> Tuple[Any, ...]:
+    """Read several variant fields in one C-level call, defaulting missing keys."""
+    try:
+        return _VARIANT_GETTERS[fields](variant)
+    except KeyError:
+        return tuple(variant.get(key, default) for key, default in fields)
+
+def start_request_cache() -> Token:
+    """Install an empty RAG cache for the current request."""
+    return _REQUEST_CACHE.set({})
+
+def reset_request_cache(token: Token) -> None:
+    """Drop the current request's RAG cache."""
+    _REQUEST_CACHE.reset(token)
+
+def get_knowledge_collection(collection_name: str = "genomic_knowledge", create: bool = False) -> Optional[Any]:
+    """
+    Get a vector store collection, reusing the handle across calls.
+    
+    Parameters
+    ----------
+    collection_name : str
+        Collection name.
+    create : bool
+        Whether to create the collection if it doesn't exist.
+        
+    Returns
+    -------
+    Collection or None
+        Chroma collection, or None if it doesn't exist and create is False.
+    """
+    collection = _COLLECTION_CACHE.get(collection_name)
+    if collection is not None:
+        return collection
+    
+    vector_store = get_vector_store()
+    try:
+        collection = vector_store.get_collection(collection_name)
+    except Exception:
+        if not create:
+            return None
+        
+        collection = vector_store.create_collection(
+            name=collection_name,
+            metadata={"description": "Genomic knowledge base for RAG"}
+        )
+    
+    _COLLECTION_CACHE[collection_name] = collection
+    return collection
+
+def _semantic_cache_key(user_query: str, fingerprint: str) -> str:
+    """
+    Combine the analysis fingerprint with the rsIDs and genes in a query.
+    
+    Parameters
+    ----------
+    user_query : str
+        User's question.
+    fingerprint : str
+        Analysis context fingerprint from context_fingerprint().
+        
+    Returns
+    -------
+    str
+        Hex digest for SemanticCache lookups.
+    """
+    entities = sorted({match.upper() for match in _QUERY_ENTITY_PATTERN.findall(user_query)})
+    payload = '\x1f'.join([fingerprint, *entities])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
 async def query_knowledge_base(user_query: str, analysis_context: Dict[str, Any]) -> Dict[str, Any]:
     """
     Query the knowledge base using RAG for genomic information.
@@ -27,6 +211,30 @@ async def query_knowledge_base(user_query: str, analysis_context: Dict[str, Any]
         RAG results with context and sources.
     """
     try:
+        fingerprint = context_fingerprint(analysis_context)
+        
+        # Repeat queries within the same request reuse the first result
+        request_cache = _REQUEST_CACHE.get()
+        request_key = ('rag', user_query, fingerprint)
+        if request_cache is not None and request_key in request_cache:
+            return request_cache[request_key]
+        
+        # Serve semantically equivalent questions about the same variants
+        # and genes from the cache
+        semantic_key = _semantic_cache_key(user_query, fingerprint)
+        query_embedding = await get_query_embeddings(user_query)
+        if query_embedding:
+            cached = _SEMANTIC_CACHE.get(query_embedding, semantic_key)
+            if cached is not None:
+                return {**cached, 'sources': list(cached['sources']), 'query': user_query}
+        
+        # Vector search and the ClinVar query are independent, so run them
+        # concurrently while the analysis context is built
+        vector_task = asyncio.create_task(search_vector_database(user_query))
+        clinvar_task = asyncio.create_task(
+            asyncio.to_thread(get_clinvar_context, user_query, analysis_context)
+        )
+        
         # Get relevant context from multiple sources
         contexts = []
         sources = []
@@ -37,27 +245,43 @@ async def query_knowledge_base(user_query: str, analysis_context: Dict[str, Any]
             contexts.append(analysis_context_text)
             sources.append("Resultados da sua análise genômica")
         
+        vector_context, clinvar_context = await asyncio.gather(
+            vector_task, clinvar_task, return_exceptions=True
+        )
+        
         # 2. Search vector database for relevant genomic knowledge
-        vector_context = await search_vector_database(user_query)
-        if vector_context:
+        if isinstance(vector_context, Exception):
+            logger.error(f"Error searching vector database: {vector_context}")
+        elif vector_context:
             contexts.extend(vector_context['contexts'])
             sources.extend(vector_context['sources'])
         
         # 3. Get relevant ClinVar information
-        clinvar_context = get_clinvar_context(user_query, analysis_context)
-        if clinvar_context:
+        if isinstance(clinvar_context, Exception):
+            logger.error(f"Error getting ClinVar context: {clinvar_context}")
+        elif clinvar_context:
             contexts.append(clinvar_context)
             sources.append("Base de dados ClinVar")
         
-        # Combine all contexts
-        combined_context = "\n\n".join(contexts[:5])  # Limit to avoid token overflow
+        # Combine contexts in priority order within the character budget
+        combined_context, used_sources = merge_contexts(contexts, sources)
         
-        return {
+        result = {
             'context': combined_context,
-            'sources': sources[:5],
+            'sources': used_sources,
             'query': user_query
         }
         
+        if query_embedding:
+            # Sources are stored as a tuple so callers can't mutate the entry
+            _SEMANTIC_CACHE.put(
+                query_embedding, semantic_key, {**result, 'sources': tuple(used_sources)}
+            )
+        if request_cache is not None:
+            request_cache[request_key] = result
+        
+        return result
+        
     except Exception as e:
         logger.error(f"Error in RAG query: {e}")
         return {
@@ -66,7 +290,48 @@ async def query_knowledge_base(user_query: str, analysis_context: Dict[str, Any]
             'query': user_query
         }
 
-async def search_vector_database(query: str) -> Optional[Dict[str, Any]]:
+def merge_contexts(
+    contexts: List[str], 
+    sources: List[str], 
+    max_chars: int = MAX_CONTEXT_CHARS
+) -> Tuple[str, List[str]]:
+    """
+    Join contexts in priority order until the character budget is spent.
+    
+    Parameters
+    ----------
+    contexts : list
+        Context texts, highest priority first.
+    sources : list
+        Source label for each context.
+    max_chars : int
+        Maximum length of the combined context.
+        
+    Returns
+    -------
+    tuple
+        (combined_context, sources) for the contexts that fit.
+    """
+    selected = []
+    used_sources = []
+    total_chars = 0
+    
+    for context, source in zip(contexts, sources):
+        separator = 2 if selected else 0
+        if total_chars + separator + len(context) > max_chars:
+            if not selected:
+                # Never return nothing just because the first context is long
+                selected.append(context[:max_chars])
+                used_sources.append(source)
+            break
+        
+        selected.append(context)
+        used_sources.append(source)
+        total_chars += separator + len(context)
+    
+    return "\n\n".join(selected), used_sources
+
+async def search_vector_database(query: str, n_results: int = 5) -> Optional[Dict[str, Any]]:
     """
     Search the vector database for relevant documents.
     
@@ -74,6 +339,8 @@ async def search_vector_database(query: str) -> Optional[Dict[str, Any]]:
     ----------
     query : str
         Search query.
+    n_results : int
+        Number of documents to retrieve.
         
     Returns
     -------
@@ -87,50 +354,117 @@ async def search_vector_database(query: str) -> Optional[Dict[str, Any]]:
             return None
         
         # Search vector database
-        vector_store = get_vector_store()
-        
-        # Try to get or create collection
-        try:
-            collection = vector_store.get_collection("genomic_knowledge")
-        except Exception:
+        collection = get_knowledge_collection("genomic_knowledge")
+        if collection is None:
             # Collection doesn't exist yet
             logger.info("Genomic knowledge collection not found, creating empty response")
             return None
         
         # Query the collection
-        results = collection.query(
-            query_embeddings=[embeddings],
-            n_results=5,
-            include=['documents', 'metadatas']
-        )
+        try:
+            results = collection.query(
+                query_embeddings=[embeddings],
+                n_results=n_results,
+                include=['documents', 'metadatas']
+            )
+        except Exception:
+            # The cached handle may be stale (e.g. collection was recreated)
+            _COLLECTION_CACHE.pop("genomic_knowledge", None)
+            raise
         
         if not results['documents'] or not results['documents'][0]:
             return None
         
-        contexts = []
-        sources = []
-        
-        for i, doc in enumerate(results['documents'][0]):
-            contexts.append(doc)
-            
-            # Get source from metadata if available
-            if results['metadatas'] and results['metadatas'][0] and i < len(results['metadatas'][0]):
-                metadata = results['metadatas'][0][i]
-                source = metadata.get('source', 'Conhecimento genômico')
-            else:
-                source = 'Conhecimento genômico'
-            
-            sources.append(source)
+        # Metadatas are aligned with documents whenever they are included
+        contexts = results['documents'][0]
+        metadatas = results['metadatas'][0] if results.get('metadatas') else [None] * len(contexts)
         
         return {
             'contexts': contexts,
-            'sources': sources
+            'sources': [(metadata or {}).get('source', 'Conhecimento genômico') for metadata in metadatas]
         }
         
     except Exception as e:
         logger.error(f"Error searching vector database: {e}")
         return None
 
+async def close_http_client() -> None:
+    """Close the shared LLM service client on application shutdown."""
+    await _HTTP_CLIENT.aclose()
+
+def truncate_for_embedding(text: str, max_words: int = MAX_EMBEDDING_WORDS) -> str:
+    """
+    Drop text the embedding model would truncate anyway.
+    
+    Parameters
+    ----------
+    text : str
+        Text to embed.
+    max_words : int
+        Maximum number of whitespace-separated words kept.
+        
+    Returns
+    -------
+    str
+        The text unchanged if short enough, otherwise its first max_words words.
+    """
+    words = text.split(maxsplit=max_words)
+    if len(words) <= max_words:
+        return text
+    return " ".join(words[:max_words])
+
+def _embedding_key(text: str) -> str:
+    """Content hash used to key cached embeddings."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def get_embedding_disk_cache() -> Optional[Cache]:
+    """
+    Get or open the on-disk embedding cache.
+    
+    Returns
+    -------
+    Cache or None
+        Embedding cache, or None if the cache directory is unusable.
+    """
+    global _embedding_disk_cache
+    
+    with _embedding_disk_cache_lock:
+        if _embedding_disk_cache is None:
+            cache_dir = os.getenv("EMBEDDING_CACHE_DIRECTORY", "/app/data/cache/embeddings")
+            try:
+                _embedding_disk_cache = Cache(cache_dir)
+            except Exception as e:
+                logger.warning(f"Embedding disk cache unavailable at {cache_dir}: {e}")
+                return None
+    
+    return _embedding_disk_cache
+
+def _decode_embedding(stored: Any) -> List[float]:
+    """Turn an on-disk embedding cache entry back into a list of floats."""
+    # Entries written before int8 quantization hold plain float32 arrays
+    if isinstance(stored, np.ndarray):
+        return stored.tolist()
+    return dequantize_int8(*stored).tolist()
+
+def _read_disk_embeddings(keys: List[str]) -> List[Optional[List[float]]]:
+    """Look keys up in the on-disk embedding cache; blocking, so run it off the event loop."""
+    disk_cache = get_embedding_disk_cache()
+    if disk_cache is None:
+        return [None] * len(keys)
+    
+    stored = (disk_cache.get(key) for key in keys)
+    return [_decode_embedding(entry) if entry is not None else None for entry in stored]
+
+def _write_disk_embeddings(items: List[Tuple[str, List[float]]]):
+    """Store embeddings in the on-disk cache; blocking, so run it off the event loop."""
+    disk_cache = get_embedding_disk_cache()
+    if disk_cache is None:
+        return
+    
+    for key, embedding in items:
+        # int8 values pickle to a sixteenth of a list of floats
+        disk_cache.set(key, quantize_int8(embedding))
+
 async def get_query_embeddings(query: str) -> Optional[List[float]]:
     """
     Get embeddings for a query using the LLM service.
@@ -146,78 +480,159 @@ async def get_query_embeddings(query: str) -> Optional[List[float]]:
         Query embeddings.
     """
     try:
-        llm_service_url = "http://llm:8001"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{llm_service_url}/embeddings",
-                json={"texts": [query]},
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Embeddings service error: {response.status_code}")
-                return None
-            
-            result = response.json()
-            embeddings = result.get("embeddings", [])
-            
-            if embeddings:
-                return embeddings[0]
-            
+        query = truncate_for_embedding(query)
+        cache_key = _embedding_key(query)
+        
+        # The request-scoped memo also spares re-reading the TTL and disk caches
+        request_cache = _REQUEST_CACHE.get()
+        request_key = ('embedding', cache_key)
+        if request_cache is not None and request_key in request_cache:
+            return request_cache[request_key]
+        
+        cached = _EMBEDDING_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # SQLite and file reads; only reached after the in-memory cache misses
+        [stored] = await asyncio.to_thread(_read_disk_embeddings, [cache_key])
+        if stored is not None:
+            _EMBEDDING_CACHE[cache_key] = stored
+            if request_cache is not None:
+                request_cache[request_key] = stored
+            return stored
+        
+        response = await _HTTP_CLIENT.post("/embeddings", json={"texts": [query]})
+        
+        if response.status_code != 200:
+            logger.error(f"Embeddings service error: {response.status_code}")
             return None
         
+        result = response.json()
+        embeddings = result.get("embeddings", [])
+        
+        if embeddings:
+            _EMBEDDING_CACHE[cache_key] = embeddings[0]
+            await asyncio.to_thread(_write_disk_embeddings, [(cache_key, embeddings[0])])
+            if request_cache is not None:
+                request_cache[request_key] = embeddings[0]
+            return embeddings[0]
+        
+        return None
+        
     except Exception as e:
         logger.error(f"Error getting query embeddings: {e}")
         return None
 
-def build_analysis_context(analysis_context: Dict[str, Any]) -> str:
+async def get_embeddings_batch(
+    texts: List[str], 
+    batch_size: int = 32, 
+    max_concurrency: int = 5
+) -> Optional[List[List[float]]]:
     """
-    Build context text from analysis results.
+    Get embeddings for many texts with batched, concurrent requests.
+    
+    Texts already in the on-disk embedding cache are not sent.
     
     Parameters
     ----------
-    analysis_context : dict
-        Analysis context.
+    texts : list
+        Texts to embed.
+    batch_size : int
+        Number of texts sent per request.
+    max_concurrency : int
+        Maximum number of requests in flight.
         
     Returns
     -------
-    str
-        Formatted context text.
+    list or None
+        One embedding per text, in input order.
     """
     try:
-        filename = analysis_context.get('filename', 'arquivo')
-        summary = analysis_context.get('summary', {})
-        significant_variants = analysis_context.get('significant_variants', [])
+        texts = [truncate_for_embedding(text) for text in texts]
+        keys = [_embedding_key(text) for text in texts]
+        embeddings = await asyncio.to_thread(_read_disk_embeddings, keys)
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        # Longest first, so each batch holds texts of similar length and
+        # the service pads less
+        missing.sort(key=lambda i: len(texts[i]), reverse=True)
+        
+        missing_texts = [texts[i] for i in missing]
+        batches = [missing_texts[i:i + batch_size] for i in range(0, len(missing_texts), batch_size)]
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                response = await _HTTP_CLIENT.post("/embeddings", json={"texts": batch})
+            response.raise_for_status()
+            
+            batch_embeddings = response.json().get("embeddings", [])
+            if len(batch_embeddings) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(batch_embeddings)}")
+            return batch_embeddings
+        
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
         
-        context_parts = []
+        fetched = [embedding for batch_embeddings in results for embedding in batch_embeddings]
+        for i, embedding in zip(missing, fetched):
+            embeddings[i] = embedding
+        await asyncio.to_thread(_write_disk_embeddings, [(keys[i], embeddings[i]) for i in missing])
         
-        # Summary information
-        context_parts.append(f"Análise do arquivo {filename}:")
-        context_parts.append(f"- Total de variantes analisadas: {analysis_context.get('total_variants', 0)}")
+        return embeddings
         
-        for classification, count in summary.items():
-            context_parts.append(f"- {classification}: {count} variantes")
+    except Exception as e:
+        logger.error(f"Error getting batch embeddings: {e}")
+        return None
+
+def _iter_analysis_context_lines(analysis_context: Dict[str, Any]) -> Iterator[str]:
+    """Yield the lines of the analysis context text."""
+    filename = analysis_context.get('filename', 'arquivo')
+    summary = analysis_context.get('summary', {})
+    significant_variants = analysis_context.get('significant_variants', [])
+    
+    # Summary information
+    yield f"Análise do arquivo {filename}:"
+    yield f"- Total de variantes analisadas: {analysis_context.get('total_variants', 0)}"
+    
+    for classification, count in summary.items():
+        yield f"- {classification}: {count} variantes"
+    
+    # Significant variants details
+    if significant_variants:
+        yield "\nVariantes de interesse clínico identificadas:"
         
-        # Significant variants details
-        if significant_variants:
-            context_parts.append("\nVariantes de interesse clínico identificadas:")
+        for variant in islice(significant_variants, 5):  # Limit to first 5
+            rsid, classification, genotype, interpretation = _variant_fields(
+                variant, _ANALYSIS_VARIANT_FIELDS
+            )
             
-            for variant in significant_variants[:5]:  # Limit to first 5
-                rsid = variant.get('rsID', 'desconhecido')
-                classification = variant.get('classification', 'desconhecida')
-                genotype = variant.get('genotype', 'desconhecido')
-                interpretation = variant.get('clinical_interpretation', '')
-                
-                variant_text = f"- {rsid} (genótipo {genotype}): classificada como {classification}"
-                if interpretation:
-                    # Truncate interpretation to avoid too much text
-                    short_interpretation = interpretation[:200] + "..." if len(interpretation) > 200 else interpretation
-                    variant_text += f". {short_interpretation}"
-                
-                context_parts.append(variant_text)
+            variant_text = f"- {rsid} (genótipo {genotype}): classificada como {classification}"
+            if interpretation:
+                # Truncate interpretation to avoid too much text
+                ellipsis = "..." if len(interpretation) > 200 else ""
+                variant_text += f". {interpretation[:200]}{ellipsis}"
+            
+            yield variant_text
+
+def build_analysis_context(analysis_context: Dict[str, Any]) -> str:
+    """
+    Build context text from analysis results.
+    
+    Parameters
+    ----------
+    analysis_context : dict
+        Analysis context.
         
-        return "\n".join(context_parts)
+    Returns
+    -------
+    str
+        Formatted context text.
+    """
+    try:
+        return "\n".join(_iter_analysis_context_lines(analysis_context))
         
     except Exception as e:
         logger.error(f"Error building analysis context: {e}")
@@ -250,13 +665,13 @@ def get_clinvar_context(query: str, analysis_context: Dict[str, Any]) -> Optiona
             if pathogenic_variants:
                 context_parts = ["Exemplos de variantes patogênicas conhecidas no ClinVar:"]
                 
-                for variant in pathogenic_variants[:5]:
-                    rsid = variant.get('rsID', 'desconhecido')
-                    gene = variant.get('gene_symbol', 'gene desconhecido')
-                    significance = variant.get('clinical_significance', 'significado desconhecido')
-                    phenotype = variant.get('phenotype', 'fenótipo não especificado')
+                append = context_parts.append
+                for variant in islice(pathogenic_variants, 5):
+                    rsid, gene, significance, phenotype = _variant_fields(
+                        variant, _PATHOGENIC_VARIANT_FIELDS
+                    )
                     
-                    context_parts.append(
+                    append(
                         f"- {rsid} no gene {gene}: {significance}. Associado a {phenotype}"
                     )
                 
@@ -265,12 +680,12 @@ def get_clinvar_context(query: str, analysis_context: Dict[str, Any]) -> Optiona
             # Use variants from user's analysis
             context_parts = ["Informações ClinVar sobre suas variantes:"]
             
-            for variant in significant_variants[:3]:
-                rsid = variant.get('rsID', '')
-                classification = variant.get('classification', '')
+            append = context_parts.append
+            for variant in islice(significant_variants, 3):
+                rsid, classification = _variant_fields(variant, _CLASSIFIED_VARIANT_FIELDS)
                 
-                if rsid and classification in ['Patogênica', 'Provavelmente Patogênica']:
-                    context_parts.append(
+                if rsid and classification in ('Patogênica', 'Provavelmente Patogênica'):
+                    append(
                         f"- {rsid}: classificada como {classification} com base em evidências do ClinVar"
                     )
             
@@ -283,6 +698,10 @@ def get_clinvar_context(query: str, analysis_context: Dict[str, Any]) -> Optiona
         logger.error(f"Error getting ClinVar context: {e}")
         return None
 
+def _document_id(document: str, prefix: str = "kb") -> str:
+    """Stable document ID derived from its content, so re-adds are idempotent."""
+    return f"{prefix}-{hashlib.sha256(document.encode()).hexdigest()[:24]}"
+
 async def add_document_to_knowledge_base(
     document: str, 
     metadata: Dict[str, Any], 
@@ -306,34 +725,31 @@ async def add_document_to_knowledge_base(
         Success status.
     """
     try:
+        # Get or create collection
+        collection = get_knowledge_collection(collection_name, create=True)
+        
+        # Skip documents that are already stored
+        doc_id = _document_id(document)
+        if collection.get(ids=[doc_id], include=[])['ids']:
+            logger.debug(f"Document already in knowledge base: {doc_id}")
+            return True
+        
         # Get embeddings for the document
         embeddings = await get_query_embeddings(document)
         if not embeddings:
             return False
         
-        # Get or create collection
-        vector_store = get_vector_store()
-        
+        # Add document
         try:
-            collection = vector_store.get_collection(collection_name)
-        except Exception:
-            # Create collection if it doesn't exist
-            collection = vector_store.create_collection(
-                name=collection_name,
-                metadata={"description": "Genomic knowledge base for RAG"}
+            collection.add(
+                documents=[document],
+                embeddings=[embeddings],
+                metadatas=[metadata],
+                ids=[doc_id]
             )
-        
-        # Generate unique ID
-        import uuid
-        doc_id = str(uuid.uuid4())
-        
-        # Add document
-        collection.add(
-            documents=[document],
-            embeddings=[embeddings],
-            metadatas=[metadata],
-            ids=[doc_id]
-        )
+        except Exception:
+            _COLLECTION_CACHE.pop(collection_name, None)
+            raise
         
         logger.info(f"Added document to knowledge base: {doc_id}")
         return True
@@ -342,48 +758,82 @@ async def add_document_to_knowledge_base(
         logger.error(f"Error adding document to knowledge base: {e}")
         return False
 
-async def populate_knowledge_base_with_clinvar():
+async def populate_knowledge_base_with_clinvar(batch_size: int = 32):
     """
     Populate the knowledge base with ClinVar information.
+    
+    Parameters
+    ----------
+    batch_size : int
+        Number of documents embedded and added per batch.
     """
     try:
         logger.info("Populating knowledge base with ClinVar data...")
         
-        # Get pathogenic variants
-        pathogenic_variants = get_pathogenic_variants(limit=100)
+        # Get pathogenic variants off the event loop (blocking DuckDB query)
+        pathogenic_variants = await asyncio.to_thread(get_pathogenic_variants, limit=100)
         
-        added_count = 0
+        # Keyed by content-hash ID, which also drops duplicate documents
+        pending: Dict[str, Tuple[str, Dict[str, Any]]] = {}
         for variant in pathogenic_variants:
+            # Create document text
+            rsid = variant.get('rsID', '')
+            gene = variant.get('gene_symbol', '')
+            significance = variant.get('clinical_significance', '')
+            phenotype = variant.get('phenotype', '')
+            consequence = variant.get('molecular_consequence', '')
+            
+            document = f"""
+            Variante genética {rsid} no gene {gene}.
+            Significado clínico: {significance}.
+            Fenótipo associado: {phenotype}.
+            Consequência molecular: {consequence}.
+            Fonte: ClinVar
+            """
+            
+            pending[_document_id(document, prefix="cv")] = (document, {
+                'source': 'ClinVar',
+                'rsID': rsid,
+                'gene': gene,
+                'significance': significance,
+                'type': 'variant_annotation'
+            })
+        
+        if not pending:
+            return 0
+        
+        collection = get_knowledge_collection("genomic_knowledge", create=True)
+        
+        # One existence check for the whole run, before any embedding work
+        existing = set(collection.get(ids=list(pending), include=[])['ids'])
+        ids = [doc_id for doc_id in pending if doc_id not in existing]
+        if not ids:
+            logger.info("All ClinVar documents already in knowledge base")
+            return 0
+        
+        documents = [pending[doc_id][0] for doc_id in ids]
+        metadatas = [pending[doc_id][1] for doc_id in ids]
+        
+        # Embed all documents in batched requests instead of one POST each
+        embeddings = await get_embeddings_batch(documents, batch_size=batch_size)
+        if not embeddings:
+            return 0
+        
+        added_count = 0
+        for start in range(0, len(documents), batch_size):
+            end = start + batch_size
             try:
-                # Create document text
-                rsid = variant.get('rsID', '')
-                gene = variant.get('gene_symbol', '')
-                significance = variant.get('clinical_significance', '')
-                phenotype = variant.get('phenotype', '')
-                consequence = variant.get('molecular_consequence', '')
-                
-                document = f"""
-                Variante genética {rsid} no gene {gene}.
-                Significado clínico: {significance}.
-                Fenótipo associado: {phenotype}.
-                Consequência molecular: {consequence}.
-                Fonte: ClinVar
-                """
-                
-                metadata = {
-                    'source': 'ClinVar',
-                    'rsID': rsid,
-                    'gene': gene,
-                    'significance': significance,
-                    'type': 'variant_annotation'
-                }
-                
-                success = await add_document_to_knowledge_base(document, metadata)
-                if success:
-                    added_count += 1
-                
+                collection.add(
+                    documents=documents[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+                added_count += len(documents[start:end])
             except Exception as e:
-                logger.warning(f"Error adding variant {variant.get('rsID', 'unknown')}: {e}")
+                logger.warning(f"Error adding ClinVar documents {start}-{end}: {e}")
+                _COLLECTION_CACHE.pop("genomic_knowledge", None)
+                collection = get_knowledge_collection("genomic_knowledge", create=True)
                 continue
         
         logger.info(f"Added {added_count} ClinVar documents to knowledge base")
@@ -411,38 +861,17 @@ def get_relevant_context(query: str, context_type: str = "general") -> str:
     """
     try:
         query_lower = query.lower()
+        matched_routes = {
+            _CONTEXT_ROUTE_BY_TERM[match.group(0)]
+            for match in _CONTEXT_ROUTE_PATTERN.finditer(query_lower)
+        }
         
-        # ACMG guidelines context
-        if any(term in query_lower for term in ['acmg', 'classificação', 'critérios', 'guidelines']):
-            return """
-            As diretrizes ACMG-2015 (American College of Medical Genetics) estabelecem critérios padronizados 
-            para classificação de variantes genéticas em cinco categorias:
-            1. Patogênica: Variante que causa doença
-            2. Provavelmente Patogênica: Evidência forte de patogenicidade
-            3. VUS (Variante de Significado Incerto): Evidência insuficiente
-            4. Provavelmente Benigna: Evidência de que não causa doença
-            5. Benigna: Variante normal na população
-            
-            Os critérios incluem evidência populacional, computacional, funcional e segregação familiar.
-            """
-        
-        # 23andMe limitations context
-        if any(term in query_lower for term in ['23andme', 'limitações', 'limitations']):
-            return """
-            Limitações dos dados 23andMe:
-            - Cobertura limitada do genoma (aproximadamente 600.000 variantes)
-            - Foco em SNPs comuns, não incluindo indels ou variantes estruturais
-            - Não substitui sequenciamento clínico completo
-            - Dados podem ter taxa de erro de genotipagem
-            - Interpretação requer validação clínica
-            """
+        for route, _, context in _CONTEXT_ROUTES:
+            if route in matched_routes:
+                return context
         
         # General genomics context
-        return """
-        A análise genômica moderna utiliza bancos de dados como ClinVar e gnomAD para interpretar variantes.
-        ClinVar fornece classificações clínicas de variantes, enquanto gnomAD oferece frequências populacionais.
-        A interpretação deve sempre considerar o contexto clínico e histórico familiar.
-        """
+        return GENERAL_CONTEXT
         
     except Exception as e:
         logger.error(f"Error getting relevant context: {e}")
@@ -2,17 +2,177 @@
 Report generator service for creating PDF reports from analysis results.
 """
 
+import asyncio
 import os
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Optional
 from datetime import datetime
+from functools import lru_cache
 import logging
-from jinja2 import Template
-import markdown
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
 from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
 from io import StringIO
 
 logger = logging.getLogger(__name__)
 
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+TEMPLATE_NAMES = {'pt-BR': "report_pt.md.j2", 'en': "report_en.md.j2"}
+HTML_TEMPLATE_NAMES = {'pt-BR': "report_pt.html.j2", 'en': "report_en.html.j2"}
+
+# Classifications listed under clinically significant variants in each language
+SIGNIFICANT_CLASSIFICATIONS = {
+    'pt-BR': frozenset({"Patogênica", "Provavelmente Patogênica"}),
+    'en': frozenset({"Pathogenic", "Likely Pathogenic", "Patogênica", "Provavelmente Patogênica"})
+}
+
+def _get_bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    """Persist compiled templates so new processes skip lexing and parsing."""
+    cache_dir = os.getenv("JINJA_CACHE_DIR", "/tmp/jinja_cache")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        # A read-only or missing cache location must not break the import;
+        # templates are then compiled in memory only
+        logger.warning(f"Jinja bytecode cache disabled ({cache_dir}): {e}")
+        return None
+    return FileSystemBytecodeCache(directory=cache_dir, pattern="__jinja2_%s.cache")
+
+# Shared environment for report templates; datetime is available to every template
+_ENV = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    bytecode_cache=_get_bytecode_cache(),
+    autoescape=lambda name: name is not None and name.endswith('.html.j2'),
+    auto_reload=False
+)
+_ENV.globals['datetime'] = datetime
+
+# Font discovery is expensive; every PDF reuses this configuration
+_FONT_CONFIG = FontConfiguration()
+# WeasyPrint does not promise that a FontConfiguration (and its Pango font
+# map) or a parsed CSS can be shared by threads rendering at the same time,
+# so in-process renders take turns
+_RENDER_LOCK = threading.Lock()
+
+@lru_cache(maxsize=None)
+def get_report_template(language: str) -> Template:
+    """
+    Get the compiled report template for a language.
+    
+    Templates are compiled once per process, and loaded from the on-disk
+    bytecode cache when another process already compiled them.
+    
+    Parameters
+    ----------
+    language : str
+        Report language ('pt-BR' or 'en').
+        
+    Returns
+    -------
+    Template
+        Compiled Jinja template.
+    """
+    return _ENV.get_template(TEMPLATE_NAMES.get(language, TEMPLATE_NAMES['en']))
+
+@lru_cache(maxsize=None)
+def get_report_html_template(language: str) -> Template:
+    """
+    Get the compiled HTML report template for a language.
+    
+    Parameters
+    ----------
+    language : str
+        Report language ('pt-BR' or 'en').
+        
+    Returns
+    -------
+    Template
+        Compiled Jinja template producing a complete HTML document.
+    """
+    return _ENV.get_template(HTML_TEMPLATE_NAMES.get(language, HTML_TEMPLATE_NAMES['en']))
+
+@lru_cache(maxsize=None)
+def get_pdf_stylesheet() -> CSS:
+    """
+    Get the parsed PDF stylesheet.
+    
+    The CSS is tokenized once and shares a single FontConfiguration, so
+    fonts are discovered once per process instead of once per PDF.
+    
+    Returns
+    -------
+    CSS
+        Stylesheet bound to the shared font configuration.
+    """
+    return CSS(string=get_pdf_css(), font_config=_FONT_CONFIG)
+
+def warm_report_templates() -> None:
+    """Compile every report template and the PDF stylesheet ahead of the first report."""
+    for language in TEMPLATE_NAMES:
+        get_report_template(language)
+        get_report_html_template(language)
+    get_pdf_stylesheet()
+
+# Summary counts shown with their share of all variants
+SUMMARY_CLASSIFICATIONS = ('pathogenic', 'likely_pathogenic', 'vus', 'likely_benign', 'benign')
+
+def _enrich_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add formatted percentages for each classification count.
+    
+    Parameters
+    ----------
+    summary : dict
+        Classification counts and total_variants.
+        
+    Returns
+    -------
+    dict
+        Summary with a ``pct_<classification>`` string per count.
+    """
+    total = summary.get('total_variants') or 0
+    enriched = dict(summary)
+    for key in SUMMARY_CLASSIFICATIONS:
+        enriched[f'pct_{key}'] = f"{100 * summary.get(key, 0) / total:.1f}" if total else "0.0"
+    return enriched
+
+def _build_template_context(report_data: Dict[str, Any], language: str) -> Dict[str, Any]:
+    """
+    Add the variant lists the report templates display.
+    
+    Significant and VUS variants are split out in a single Python pass
+    instead of two selectattr filters inside every template render, and
+    summary percentages are formatted here rather than in the template.
+    
+    Parameters
+    ----------
+    report_data : dict
+        Report data including variants and summary.
+    language : str
+        Normalized report language ('pt-BR' or 'en').
+        
+    Returns
+    -------
+    dict
+        Template context.
+    """
+    significant = SIGNIFICANT_CLASSIFICATIONS[language]
+    significant_variants = []
+    vus_variants = []
+    for variant in report_data.get('variants', []):
+        classification = variant.get('classification')
+        if classification in significant:
+            significant_variants.append(variant)
+        elif classification == "VUS":
+            vus_variants.append(variant)
+    
+    return {
+        **report_data,
+        'summary': _enrich_summary(report_data.get('summary', {})),
+        'significant_variants': significant_variants,
+        'vus_variants': vus_variants
+    }
+
 def generate_markdown_report(report_data: Dict[str, Any]) -> str:
     """
     Generate markdown content for genomic analysis report.
@@ -30,13 +190,10 @@ def generate_markdown_report(report_data: Dict[str, Any]) -> str:
     try:
         language = report_data.get('language', 'pt-BR')
         
-        if language == 'pt-BR':
-            template = get_portuguese_template()
-        else:
-            template = get_english_template()
-        
-        jinja_template = Template(template)
-        markdown_content = jinja_template.render(**report_data)
+        # Normalize so enum members and plain strings share one cache entry
+        language = 'pt-BR' if language == 'pt-BR' else 'en'
+        jinja_template = get_report_template(language)
+        markdown_content = jinja_template.render(**_build_template_context(report_data, language))
         
         return markdown_content
         
@@ -44,18 +201,44 @@ def generate_markdown_report(report_data: Dict[str, Any]) -> str:
         logger.error(f"Error generating markdown report: {e}")
         raise e
 
-def generate_pdf_report(markdown_content: str, output_path: str, language: str = 'pt-BR') -> bool:
+def generate_html_report(report_data: Dict[str, Any]) -> str:
     """
-    Generate PDF report from markdown content.
+    Generate the HTML document for a genomic analysis report.
+    
+    Renders the same content as generate_markdown_report() directly as
+    HTML, so the PDF path needs no markdown conversion.
     
     Parameters
     ----------
-    markdown_content : str
-        Markdown content to convert.
+    report_data : dict
+        Report data including variants and summary.
+        
+    Returns
+    -------
+    str
+        HTML content.
+    """
+    try:
+        language = report_data.get('language', 'pt-BR')
+        
+        language = 'pt-BR' if language == 'pt-BR' else 'en'
+        jinja_template = get_report_html_template(language)
+        return jinja_template.render(**_build_template_context(report_data, language))
+        
+    except Exception as e:
+        logger.error(f"Error generating HTML report: {e}")
+        raise e
+
+def generate_pdf_from_html(html_content: str, output_path: str) -> bool:
+    """
+    Generate PDF report from a complete HTML document.
+    
+    Parameters
+    ----------
+    html_content : str
+        HTML document, e.g. from generate_html_report().
     output_path : str
         Path to save PDF file.
-    language : str
-        Report language for styling.
         
     Returns
     -------
@@ -63,31 +246,12 @@ def generate_pdf_report(markdown_content: str, output_path: str, language: str =
         True if successful, False otherwise.
     """
     try:
-        # Convert markdown to HTML
-        html_content = markdown.markdown(
-            markdown_content,
-            extensions=['tables', 'codehilite', 'toc']
-        )
-        
-        # Wrap in HTML document
-        full_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Relatório de Análise Genômica</title>
-            <style>
-                {get_pdf_css()}
-            </style>
-        </head>
-        <body>
-            {html_content}
-        </body>
-        </html>
-        """
-        
-        # Generate PDF
-        HTML(string=full_html).write_pdf(output_path)
+        with _RENDER_LOCK:
+            HTML(string=html_content).write_pdf(
+                output_path,
+                stylesheets=[get_pdf_stylesheet()],
+                font_config=_FONT_CONFIG
+            )
         
         logger.info(f"PDF report generated: {output_path}")
         return True
@@ -96,263 +260,29 @@ def generate_pdf_report(markdown_content: str, output_path: str, language: str =
         logger.error(f"Error generating PDF report: {e}")
         return False
 
-def get_portuguese_template() -> str:
-    """Get Portuguese report template."""
-    return """
-# Relatório de Análise Genômica
-
-**Data de Geração:** {{ datetime.now().strftime('%d/%m/%Y %H:%M') }}  
-**Arquivo Analisado:** {{ filename }}  
-**ID da Análise:** {{ upload_id }}  
-
----
-
-## Resumo Executivo
-
-Esta análise genômica foi realizada sobre o arquivo **{{ filename }}** utilizando dados do 23andMe. O relatório apresenta a classificação de {{ summary.total_variants }} variantes genéticas de acordo com as diretrizes ACMG-2015 simplificadas.
-
-### Estatísticas Gerais
-
-| Classificação | Quantidade | Percentual |
-|--------------|------------|-------------|
-| **Patogênica** | {{ summary.pathogenic }} | {{ "%.1f"|format((summary.pathogenic / summary.total_variants) * 100) }}% |
-| **Provavelmente Patogênica** | {{ summary.likely_pathogenic }} | {{ "%.1f"|format((summary.likely_pathogenic / summary.total_variants) * 100) }}% |
-| **VUS (Significado Incerto)** | {{ summary.vus }} | {{ "%.1f"|format((summary.vus / summary.total_variants) * 100) }}% |
-| **Provavelmente Benigna** | {{ summary.likely_benign }} | {{ "%.1f"|format((summary.likely_benign / summary.total_variants) * 100) }}% |
-| **Benigna** | {{ summary.benign }} | {{ "%.1f"|format((summary.benign / summary.total_variants) * 100) }}% |
-
----
-
-## Variantes de Significado Clínico
-
-{% set significant_variants = variants | selectattr("classification", "in", ["Patogênica", "Provavelmente Patogênica"]) | list %}
-
-{% if significant_variants %}
-### Variantes Patogênicas e Provavelmente Patogênicas
-
-{% for variant in significant_variants[:10] %}
-#### {{ variant.rsID }} - {{ variant.classification }}
-
-**Localização:** Cromossomo {{ variant.chromosome }}, posição {{ variant.position }}  
-**Genótipo:** {{ variant.genotype }}  
-**Nível de Confiança:** {{ "%.1f"|format(variant.confidence_score * 100) }}%
-
-{{ variant.clinical_interpretation }}
-
----
-{% endfor %}
-
-{% if significant_variants|length > 10 %}
-*Nota: Este relatório mostra as primeiras 10 variantes significativas. O total de variantes patogênicas/provavelmente patogênicas é {{ significant_variants|length }}.*
-{% endif %}
-
-{% else %}
-### Nenhuma Variante Patogênica Identificada
-
-Não foram identificadas variantes classificadas como patogênicas ou provavelmente patogênicas nesta análise.
-
-{% endif %}
-
----
-
-## Variantes de Significado Incerto (VUS)
-
-{% set vus_variants = variants | selectattr("classification", "equalto", "VUS") | list %}
-
-{% if vus_variants %}
-Foram identificadas {{ vus_variants|length }} variantes de significado incerto (VUS). Estas variantes requerem mais evidências científicas para determinação de seu impacto clínico.
-
-### Primeiras 5 Variantes VUS
-
-{% for variant in vus_variants[:5] %}
-- **{{ variant.rsID }}** (Chr{{ variant.chromosome }}:{{ variant.position }}) - Genótipo: {{ variant.genotype }}
-{% endfor %}
-
-{% if vus_variants|length > 5 %}
-*E mais {{ vus_variants|length - 5 }} variantes VUS...*
-{% endif %}
-
-{% endif %}
-
----
-
-## Metodologia
-
-### Dados Utilizados
-- **Fonte dos Dados:** Arquivo 23andMe (.txt)
-- **Banco de Dados de Referência:** ClinVar, gnomAD
-- **Diretrizes de Classificação:** ACMG-2015 (versão simplificada)
-- **Modelo de IA:** PubMedBERT para interpretação clínica
-
-### Limitações
-1. Esta análise utiliza uma versão simplificada das diretrizes ACMG-2015
-2. Os dados do 23andMe possuem limitações em comparação com sequenciamento clínico
-3. Interpretações clínicas são geradas por IA e devem ser validadas por profissional habilitado
-4. Variantes raras podem não ter dados suficientes para classificação definitiva
-
----
-
-## Recomendações
-
-{% if summary.pathogenic > 0 or summary.likely_pathogenic > 0 %}
-⚠️ **IMPORTANTE:** Foram identificadas variantes potencialmente significativas. Recomenda-se:
-
-1. Consulta com médico geneticista
-2. Validação por sequenciamento clínico
-3. Aconselhamento genético familiar
-4. Acompanhamento médico especializado
-{% else %}
-✅ **Resultado Favorável:** Não foram identificadas variantes patogênicas conhecidas. 
-
-**Recomendações:**
-1. Manter acompanhamento médico de rotina
-2. Reavaliar periodicamente conforme novas evidências científicas
-3. Considerar histórico familiar para decisões clínicas
-{% endif %}
-
----
-
-## Considerações Importantes
-
-Este relatório é baseado em análise computacional de dados genéticos e **NÃO substitui consulta médica especializada**. As interpretações apresentadas devem ser validadas por profissional habilitado antes de qualquer decisão clínica.
-
-Para mais informações ou dúvidas sobre este relatório, utilize o sistema de chat disponível na plataforma.
-
----
-
-*Relatório gerado pelo sistema Genomic-LLM v1.0 em {{ datetime.now().strftime('%d/%m/%Y às %H:%M') }}*
-"""
-
-def get_english_template() -> str:
-    """Get English report template."""
-    return """
-# Genomic Analysis Report
-
-**Generation Date:** {{ datetime.now().strftime('%m/%d/%Y %H:%M') }}  
-**Analyzed File:** {{ filename }}  
-**Analysis ID:** {{ upload_id }}  
-
----
-
-## Executive Summary
-
-This genomic analysis was performed on the file **{{ filename }}** using 23andMe data. The report presents the classification of {{ summary.total_variants }} genetic variants according to simplified ACMG-2015 guidelines.
-
-### General Statistics
-
-| Classification | Count | Percentage |
-|---------------|-------|------------|
-| **Pathogenic** | {{ summary.pathogenic }} | {{ "%.1f"|format((summary.pathogenic / summary.total_variants) * 100) }}% |
-| **Likely Pathogenic** | {{ summary.likely_pathogenic }} | {{ "%.1f"|format((summary.likely_pathogenic / summary.total_variants) * 100) }}% |
-| **VUS (Uncertain Significance)** | {{ summary.vus }} | {{ "%.1f"|format((summary.vus / summary.total_variants) * 100) }}% |
-| **Likely Benign** | {{ summary.likely_benign }} | {{ "%.1f"|format((summary.likely_benign / summary.total_variants) * 100) }}% |
-| **Benign** | {{ summary.benign }} | {{ "%.1f"|format((summary.benign / summary.total_variants) * 100) }}% |
-
----
-
-## Clinically Significant Variants
-
-{% set significant_variants = variants | selectattr("classification", "in", ["Pathogenic", "Likely Pathogenic", "Patogênica", "Provavelmente Patogênica"]) | list %}
-
-{% if significant_variants %}
-### Pathogenic and Likely Pathogenic Variants
-
-{% for variant in significant_variants[:10] %}
-#### {{ variant.rsID }} - {{ variant.classification }}
-
-**Location:** Chromosome {{ variant.chromosome }}, position {{ variant.position }}  
-**Genotype:** {{ variant.genotype }}  
-**Confidence Level:** {{ "%.1f"|format(variant.confidence_score * 100) }}%
-
-{{ variant.clinical_interpretation }}
-
----
-{% endfor %}
-
-{% if significant_variants|length > 10 %}
-*Note: This report shows the first 10 significant variants. Total pathogenic/likely pathogenic variants: {{ significant_variants|length }}.*
-{% endif %}
-
-{% else %}
-### No Pathogenic Variants Identified
-
-No variants classified as pathogenic or likely pathogenic were identified in this analysis.
-
-{% endif %}
-
----
-
-## Variants of Uncertain Significance (VUS)
-
-{% set vus_variants = variants | selectattr("classification", "equalto", "VUS") | list %}
-
-{% if vus_variants %}
-{{ vus_variants|length }} variants of uncertain significance (VUS) were identified. These variants require more scientific evidence to determine their clinical impact.
-
-### First 5 VUS Variants
-
-{% for variant in vus_variants[:5] %}
-- **{{ variant.rsID }}** (Chr{{ variant.chromosome }}:{{ variant.position }}) - Genotype: {{ variant.genotype }}
-{% endfor %}
-
-{% if vus_variants|length > 5 %}
-*And {{ vus_variants|length - 5 }} more VUS variants...*
-{% endif %}
-
-{% endif %}
-
----
-
-## Methodology
-
-### Data Sources
-- **Data Source:** 23andMe file (.txt)
-- **Reference Databases:** ClinVar, gnomAD
-- **Classification Guidelines:** ACMG-2015 (simplified version)
-- **AI Model:** PubMedBERT for clinical interpretation
-
-### Limitations
-1. This analysis uses a simplified version of ACMG-2015 guidelines
-2. 23andMe data has limitations compared to clinical sequencing
-3. Clinical interpretations are AI-generated and should be validated by qualified professionals
-4. Rare variants may lack sufficient data for definitive classification
-
----
-
-## Recommendations
-
-{% if summary.pathogenic > 0 or summary.likely_pathogenic > 0 %}
-⚠️ **IMPORTANT:** Potentially significant variants were identified. Recommendations:
-
-1. Consultation with medical geneticist
-2. Validation through clinical sequencing
-3. Family genetic counseling
-4. Specialized medical follow-up
-{% else %}
-✅ **Favorable Result:** No known pathogenic variants were identified.
-
-**Recommendations:**
-1. Maintain routine medical follow-up
-2. Periodic reassessment as new scientific evidence emerges
-3. Consider family history for clinical decisions
-{% endif %}
-
----
-
-## Important Considerations
-
-This report is based on computational analysis of genetic data and **DOES NOT replace specialized medical consultation**. The interpretations presented should be validated by qualified professionals before any clinical decision.
-
-For more information or questions about this report, use the chat system available on the platform.
-
----
-
-*Report generated by Genomic-LLM system v1.0 on {{ datetime.now().strftime('%m/%d/%Y at %H:%M') }}*
-"""
+async def generate_pdf_from_html_async(html_content: str, output_path: str) -> bool:
+    """
+    Generate PDF report from HTML without blocking the event loop.
+    
+    WeasyPrint rendering is CPU-bound, so it runs in a worker thread;
+    concurrent renders wait for each other on _RENDER_LOCK.
+    
+    Parameters
+    ----------
+    html_content : str
+        HTML document, e.g. from generate_html_report().
+    output_path : str
+        Path to save PDF file.
+        
+    Returns
+    -------
+    bool
+        True if successful, False otherwise.
+    """
+    return await asyncio.to_thread(generate_pdf_from_html, html_content, output_path)
 
-def get_pdf_css() -> str:
-    """Get CSS styling for PDF generation."""
-    return """
+# PDF stylesheet, built once at import
+PDF_CSS = """
         @page {
             size: A4;
             margin: 2cm;
@@ -487,4 +417,8 @@ def get_pdf_css() -> str:
         .no-break {
             page-break-inside: avoid;
         }
-    """ 
\ No newline at end of file
+    """
+
+def get_pdf_css() -> str:
+    """Get CSS styling for PDF generation."""
+    return PDF_CSS 
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Semantic cache for RAG results keyed by query-embedding similarity.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import logging
+import math
+import time
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+def context_fingerprint(analysis_context: Dict[str, Any]) -> str:
+    """
+    Hash an analysis context so cached results are only reused for it.
+
+    Parameters
+    ----------
+    analysis_context : dict
+        Analysis context with variants and summary.
+
+    Returns
+    -------
+    str
+        Hex digest identifying the context.
+    """
+    payload = orjson.dumps(analysis_context, option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.sha256(payload).hexdigest()
+
+def quantize_int8(embedding: List[float]) -> Tuple[float, np.ndarray]:
+    """
+    Quantize an embedding to int8 with a per-vector scale.
+
+    Parameters
+    ----------
+    embedding : list or np.ndarray
+        Embedding to quantize.
+
+    Returns
+    -------
+    tuple
+        (scale, values) where ``values * scale`` approximates the embedding.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+    scale = peak / 127 if peak > 0 else 1.0
+    return scale, np.round(vector / scale).astype(np.int8)
+
+def dequantize_int8(scale: float, values: np.ndarray) -> np.ndarray:
+    """
+    Recover a float32 embedding from quantize_int8() output.
+
+    Parameters
+    ----------
+    scale : float
+        Per-vector scale.
+    values : np.ndarray
+        int8 values.
+
+    Returns
+    -------
+    np.ndarray
+        Approximate float32 embedding.
+    """
+    return values.astype(np.float32) * np.float32(scale)
+
+class SemanticCache:
+    """
+    Ring buffer of RAG results looked up by cosine similarity.
+
+    Query embeddings are stored int8-quantized in one contiguous matrix,
+    a quarter of the float32 size, with a per-row factor that restores
+    unit length. A lookup is a single matrix-vector product against every
+    entry with no per-entry Python work. The matrix starts small and
+    doubles until it reaches capacity.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of cached results; the oldest entry is overwritten.
+    threshold : float
+        Minimum cosine similarity for a cached result to be reused.
+    ttl : float
+        Seconds after which an entry is no longer returned.
+    """
+
+    _INITIAL_ROWS = 16
+
+    def __init__(self, capacity: int = 256, threshold: float = 0.92, ttl: float = 3600.0):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None
+        self._inv_norms = np.zeros(capacity, dtype=np.float32)
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._context_ids = np.zeros(capacity, dtype=np.uint64)
+        self._results: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._size = 0
+        self._next = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        # sqrt of a dot product skips np.linalg.norm's dispatch overhead
+        norm = math.sqrt(float(vector @ vector))
+        if norm == 0:
+            return None
+        return vector * np.float32(1.0 / norm)
+
+    @staticmethod
+    def _context_id(fingerprint: str) -> np.uint64:
+        # 64 bits of the SHA-256 digest let context matching stay vectorized
+        return np.uint64(int(fingerprint[:16], 16))
+
+    def get(self, embedding: List[float], fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the most similar cached result for the same analysis context.
+
+        Parameters
+        ----------
+        embedding : list
+            Query embedding.
+        fingerprint : str
+            Analysis context fingerprint from context_fingerprint().
+
+        Returns
+        -------
+        dict or None
+            Cached result if one is similar enough.
+        """
+        if self._size == 0:
+            return None
+
+        query = self._normalize(embedding)
+        if query is None or query.shape[0] != self._vectors.shape[1]:
+            return None
+
+        # Entries for other analyses or past their TTL never match
+        size = self._size
+        valid = (
+            (self._context_ids[:size] == self._context_id(fingerprint))
+            & (self._timestamps[:size] >= time.monotonic() - self.ttl)
+        )
+        similarities = (self._vectors[:size] @ query) * self._inv_norms[:size]
+        scores = np.where(valid, similarities, -1.0)
+
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        logger.debug(f"Semantic cache hit (similarity {scores[best]:.3f})")
+        return self._results[best]
+
+    def put(self, embedding: List[float], fingerprint: str, result: Dict[str, Any]) -> None:
+        """
+        Cache a result, overwriting the oldest entry when full.
+
+        Parameters
+        ----------
+        embedding : list
+            Query embedding.
+        fingerprint : str
+            Analysis context fingerprint from context_fingerprint().
+        result : dict
+            RAG result to cache.
+        """
+        # Quantization is scale-invariant and the row norm is restored
+        # below, so the vector needs no normalization of its own
+        vector = np.asarray(embedding, dtype=np.float32)
+        if not vector.any():
+            return
+
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            # First insert, or the embedding model changed dimension
+            rows = min(self._INITIAL_ROWS, self.capacity)
+            self._vectors = np.zeros((rows, vector.shape[0]), dtype=np.int8)
+            self._size = 0
+            self._next = 0
+        elif self._next == self._vectors.shape[0] and self._next < self.capacity:
+            # Grow by doubling until the ring reaches capacity
+            rows = min(2 * self._vectors.shape[0], self.capacity)
+            grown = np.zeros((rows, vector.shape[0]), dtype=np.int8)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+
+        _, values = quantize_int8(vector)
+
+        slot = self._next
+        self._vectors[slot] = values
+        self._inv_norms[slot] = 1.0 / math.sqrt(float(np.dot(values, values.astype(np.float32))))
+        self._timestamps[slot] = time.monotonic()
+        self._context_ids[slot] = self._context_id(fingerprint)
+        self._results[slot] = result
+
+        self._next = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
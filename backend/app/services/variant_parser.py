@@ -1,16 +1,153 @@
 """
-Parser for 23andMe .txt files using pandas.
+Parser for 23andMe .txt files using pyarrow and pandas.
 """
 
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Optional, Tuple
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from collections import Counter
 import os
 import logging
+import re
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
-def parse_23andme_txt(file_path: str) -> List[Dict[str, Any]]:
+# Chromosomes in report order; anything else is filtered out
+CHROMOSOME_ORDER = tuple(str(i) for i in range(1, 23)) + ('X', 'Y', 'MT')
+_CHROMOSOME_DTYPE = pd.CategoricalDtype(CHROMOSOME_ORDER, ordered=True)
+
+# One or two standard nucleotides, or no-call dashes; compiled once for
+# the DataFrame filter and mirrored as an anchored pattern for Arrow
+_GENOTYPE_RE = re.compile(r'[ATCG-]{1,2}')
+_ARROW_GENOTYPE_PATTERN = f"^{_GENOTYPE_RE.pattern}$"
+
+VARIANT_COLUMNS = ['rsID', 'chromosome', 'position', 'genotype']
+# Position is read as text and cast after filtering, so a '#' line inside
+# the body (e.g. a repeated column header) is dropped like any other
+# invalid row instead of failing the integer conversion of the whole file
+_ARROW_COLUMN_TYPES = {
+    'rsID': pa.string(),
+    'chromosome': pa.string(),
+    'position': pa.string(),
+    'genotype': pa.string()
+}
+_ARROW_CHROMOSOMES = pa.array(CHROMOSOME_ORDER)
+
+# Tab-separated body with no quoting; malformed rows are dropped
+_ARROW_CSV_OPTIONS = {
+    'read_options': pv.ReadOptions(column_names=VARIANT_COLUMNS),
+    'parse_options': pv.ParseOptions(delimiter='\t', quote_char=False, invalid_row_handler=lambda row: 'skip'),
+    'convert_options': pv.ConvertOptions(column_types=_ARROW_COLUMN_TYPES)
+}
+
+def _valid_variant_mask(data):
+    """
+    Build the row filter for valid variants with Arrow kernels.
+    
+    Parameters
+    ----------
+    data : pa.Table or pa.RecordBatch
+        Parsed variant rows.
+        
+    Returns
+    -------
+    pa.ChunkedArray or pa.Array
+        Boolean mask; rows with missing fields come out null and are dropped
+        by ``filter``. Comment lines fail the rsID prefix check.
+    """
+    return pc.and_(
+        pc.and_(
+            pc.and_(
+                pc.starts_with(data['rsID'], 'rs'),
+                pc.is_in(data['chromosome'], value_set=_ARROW_CHROMOSOMES)
+            ),
+            pc.match_substring_regex(data['genotype'], _ARROW_GENOTYPE_PATTERN)
+        ),
+        pc.match_substring_regex(data['position'], r'^\d+$')
+    )
+
+def _valid_variants(data):
+    """Filter rows with _valid_variant_mask() and convert positions to int64."""
+    data = data.filter(_valid_variant_mask(data))
+    columns = [
+        pc.cast(data[name], pa.int64()) if name == 'position' else data[name]
+        for name in data.schema.names
+    ]
+    return type(data).from_arrays(columns, names=data.schema.names)
+
+# 23andMe headers are a couple of KB; one read usually covers them
+HEADER_READ_SIZE = 8192
+
+# Read buffer for the variant body; fewer, larger read() calls
+PARSE_BUFFER_SIZE = 1024 * 1024
+
+def _advise_sequential(fd: int) -> None:
+    """
+    Tell the kernel a file will be read front to back, in full.
+    
+    Enables aggressive readahead and starts prefetching the whole file so
+    reads overlap with parsing. No-op where posix_fadvise is unavailable.
+    
+    Parameters
+    ----------
+    fd : int
+        Open file descriptor.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError as e:
+        logger.debug(f"posix_fadvise not applied: {e}")
+
+def _skip_header(f) -> int:
+    """
+    Advance an open 23andMe file past its leading comment block.
+    
+    Parameters
+    ----------
+    f : file object
+        File opened in text mode, positioned at the start.
+        
+    Returns
+    -------
+    int
+        Number of comment lines skipped; ``f`` is left at the first data line.
+    """
+    comment_lines = 0
+    while True:
+        offset = f.tell()
+        line = f.readline()
+        if not line.startswith('#'):
+            f.seek(offset)
+            return comment_lines
+        comment_lines += 1
+
+def find_data_offset(file_path: str) -> int:
+    """
+    Find where the data rows of a 23andMe file begin.
+    
+    Parameters
+    ----------
+    file_path : str
+        Path to the file.
+        
+    Returns
+    -------
+    int
+        Offset of the first line after the comment header, suitable for
+        the ``data_offset`` argument of parse_23andme_txt().
+    """
+    with open(file_path, 'r', newline='') as f:
+        _skip_header(f)
+        return f.tell()
+
+def parse_23andme_txt(file_path: str, data_offset: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Parseia arquivo .txt do 23andMe para lista de variantes.
     
@@ -18,6 +155,9 @@ def parse_23andme_txt(file_path: str) -> List[Dict[str, Any]]:
     ----------
     file_path : str
         Caminho para o arquivo .txt.
+    data_offset : int, optional
+        Posição da primeira linha de dados, de find_data_offset(); se
+        omitida, o cabeçalho é pulado durante a leitura.
         
     Returns
     -------
@@ -38,29 +178,38 @@ def parse_23andme_txt(file_path: str) -> List[Dict[str, Any]]:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
-        # Read the file, skipping comment lines
-        df = pd.read_csv(
-            file_path, 
-            comment='#', 
-            sep='\t',
-            names=['rsID', 'chromosome', 'position', 'genotype'],
-            dtype={
-                'rsID': 'string',
-                'chromosome': 'string', 
-                'position': 'Int64',
-                'genotype': 'string'
-            }
-        )
+        if data_offset is None:
+            data_offset = find_data_offset(file_path)
+        
+        # Header-only file; Arrow rejects an empty body
+        if data_offset >= os.path.getsize(file_path):
+            logger.info("Raw data loaded: 0 rows")
+            return []
+        
+        # Arrow tokenizes the body in native code; the offset skips the
+        # header comments and the filter below drops any later ones
+        with open(file_path, 'rb', buffering=PARSE_BUFFER_SIZE) as f:
+            _advise_sequential(f.fileno())
+            f.seek(data_offset)
+            table = pv.read_csv(f, **_ARROW_CSV_OPTIONS)
+        
+        logger.info(f"Raw data loaded: {table.num_rows} rows")
+        
+        # Apply the same filters as clean_variant_data() with Arrow kernels
+        table = _valid_variants(table)
         
-        logger.info(f"Raw data loaded: {len(df)} rows")
+        # Keep the first occurrence of each rsID
+        table = table.append_column('row', pa.array(np.arange(table.num_rows)))
+        first_rows = table.group_by('rsID', use_threads=False).aggregate([('row', 'min')])['row_min']
+        table = table.filter(pc.is_in(table['row'], value_set=first_rows))
         
-        # Clean the data
-        df_clean = clean_variant_data(df)
+        # Sort by chromosome and position, ties in file order
+        table = table.append_column('chr_order', pc.index_in(table['chromosome'], value_set=_ARROW_CHROMOSOMES))
+        table = table.sort_by([('chr_order', 'ascending'), ('position', 'ascending'), ('row', 'ascending')])
         
-        logger.info(f"Clean data: {len(df_clean)} variants")
+        variants = table.select(VARIANT_COLUMNS).to_pylist()
         
-        # Convert to list of dictionaries
-        variants = df_clean.to_dict(orient='records')
+        logger.info(f"Clean data: {len(variants)} variants")
         
         return variants
         
@@ -68,6 +217,44 @@ def parse_23andme_txt(file_path: str) -> List[Dict[str, Any]]:
         logger.error(f"Error parsing 23andMe file: {e}")
         raise e
 
+def iter_23andme_variants(file_path: str, data_offset: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream valid variants from a 23andMe file in file order.
+    
+    Rows are read in Arrow record batches, so only one batch is held in
+    memory at a time. Applies the same filters and rsID de-duplication as
+    parse_23andme_txt(), but does not sort; 23andMe exports are already
+    ordered by chromosome and position.
+    
+    Parameters
+    ----------
+    file_path : str
+        Path to the .txt file.
+    data_offset : int, optional
+        Offset of the first data line, from find_data_offset().
+        
+    Yields
+    ------
+    dict
+        Variant with rsID, chromosome, position and genotype.
+    """
+    if data_offset is None:
+        data_offset = find_data_offset(file_path)
+    if data_offset >= os.path.getsize(file_path):
+        return
+    
+    seen_rsids = set()
+    with open(file_path, 'rb', buffering=PARSE_BUFFER_SIZE) as f:
+        _advise_sequential(f.fileno())
+        f.seek(data_offset)
+        for batch in pv.open_csv(f, **_ARROW_CSV_OPTIONS):
+            for variant in _valid_variants(batch).to_pylist():
+                rsid = variant['rsID']
+                if rsid in seen_rsids:
+                    continue
+                seen_rsids.add(rsid)
+                yield variant
+
 def clean_variant_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clean and filter variant data from 23andMe.
@@ -85,26 +272,24 @@ def clean_variant_data(df: pd.DataFrame) -> pd.DataFrame:
     # Remove rows with missing data
     df_clean = df.dropna()
     
-    # Filter for valid rsIDs
-    df_clean = df_clean[df_clean['rsID'].str.startswith('rs', na=False)]
-    
-    # Filter out invalid chromosomes
-    valid_chromosomes = [str(i) for i in range(1, 23)] + ['X', 'Y', 'MT']
-    df_clean = df_clean[df_clean['chromosome'].isin(valid_chromosomes)]
-    
-    # Filter out invalid genotypes (keep only standard nucleotides)
-    valid_genotype_pattern = r'^[ATCG-]{1,2}$|^[ATCG][ATCG]$|^--$'
-    df_clean = df_clean[df_clean['genotype'].str.match(valid_genotype_pattern, na=False)]
+    # Keep valid rsIDs, chromosomes and genotypes (standard nucleotides)
+    # in a single filtering pass
+    mask = (
+        df_clean['rsID'].str.startswith('rs', na=False)
+        & df_clean['chromosome'].isin(CHROMOSOME_ORDER)
+        & df_clean['genotype'].str.fullmatch(_GENOTYPE_RE, na=False)
+    )
+    df_clean = df_clean[mask]
     
     # Remove duplicates
     df_clean = df_clean.drop_duplicates(subset=['rsID'])
     
-    # Sort by chromosome and position
-    chromosome_order = [str(i) for i in range(1, 23)] + ['X', 'Y', 'MT']
-    df_clean['chr_order'] = df_clean['chromosome'].apply(
-        lambda x: chromosome_order.index(x) if x in chromosome_order else 999
+    # Sort by chromosome and position, ordering chromosomes through an
+    # ordered categorical rather than a per-row lookup
+    df_clean = df_clean.sort_values(
+        ['chromosome', 'position'],
+        key=lambda column: column.astype(_CHROMOSOME_DTYPE) if column.name == 'chromosome' else column
     )
-    df_clean = df_clean.sort_values(['chr_order', 'position']).drop('chr_order', axis=1)
     
     return df_clean
 
@@ -135,26 +320,27 @@ def validate_23andme_format(file_path: str) -> Tuple[bool, Optional[str]]:
         if file_size < 1024:  # 1KB minimum
             return False, "File too small (<1KB)"
         
-        # Read first few lines to check format
-        with open(file_path, 'r') as f:
-            lines = []
+        # Read only the header and the first data line
+        with open(file_path, 'r', newline='') as f:
+            has_comments = _skip_header(f) > 0
+            
+            first_data_line = None
             for i, line in enumerate(f):
-                lines.append(line.strip())
-                if i >= 100:  # Check first 100 lines
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    first_data_line = line
+                    break
+                if i >= 100:  # Give up after 100 blank lines
                     break
         
         # Should have comment lines starting with #
-        has_comments = any(line.startswith('#') for line in lines)
         if not has_comments:
             return False, "Missing header comments (lines starting with #)"
         
-        # Find first data line
-        data_lines = [line for line in lines if not line.startswith('#') and line.strip()]
-        if not data_lines:
+        if first_data_line is None:
             return False, "No data lines found"
         
         # Check if first data line has 4 tab-separated columns
-        first_data_line = data_lines[0]
         columns = first_data_line.split('\t')
         if len(columns) != 4:
             return False, f"Expected 4 columns, found {len(columns)}"
@@ -190,17 +376,26 @@ def get_file_statistics(file_path: str) -> Dict[str, Any]:
         File statistics including variant counts by chromosome.
     """
     try:
-        variants = parse_23andme_txt(file_path)
+        # Count while streaming so the variant list is never materialized
+        chromosome_counts = Counter()
+        genotype_counts = Counter()
+        sample_variants = []
+        total_variants = 0
         
-        df = pd.DataFrame(variants)
+        for variant in iter_23andme_variants(file_path):
+            total_variants += 1
+            chromosome_counts[variant['chromosome']] += 1
+            genotype_counts[variant['genotype']] += 1
+            if len(sample_variants) < 5:
+                sample_variants.append(variant)
         
         stats = {
-            'total_variants': len(df),
-            'chromosomes': sorted(df['chromosome'].unique().tolist()),
-            'variants_by_chromosome': df['chromosome'].value_counts().to_dict(),
-            'genotype_distribution': df['genotype'].value_counts().to_dict(),
+            'total_variants': total_variants,
+            'chromosomes': sorted(chromosome_counts),
+            'variants_by_chromosome': dict(chromosome_counts.most_common()),
+            'genotype_distribution': dict(genotype_counts.most_common()),
             'file_size_bytes': os.path.getsize(file_path),
-            'sample_variants': variants[:5] if variants else []
+            'sample_variants': sample_variants
         }
         
         return stats
@@ -230,22 +425,34 @@ def extract_header_info(file_path: str) -> Dict[str, str]:
     header_info = {}
     
     try:
-        with open(file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line.startswith('#'):
+        # Read just the header block as bytes, in a few large reads
+        with open(file_path, 'rb') as f:
+            head = f.read(HEADER_READ_SIZE)
+            while True:
+                lines = head.split(b'\n')
+                # Stop once a complete non-comment line has been read
+                if any(not line.startswith(b'#') for line in lines[:-1]):
+                    break
+                chunk = f.read(HEADER_READ_SIZE)
+                if not chunk:
                     break
-                    
-                # Remove the # and parse key-value pairs
-                line = line[1:].strip()
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    header_info[key.strip()] = value.strip()
-                elif line:
-                    # Store lines without colons as general info
-                    if 'general_info' not in header_info:
-                        header_info['general_info'] = []
-                    header_info['general_info'].append(line)
+                head += chunk
+        
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b'#'):
+                break
+                
+            # Remove the # and parse key-value pairs
+            line = line[1:].strip()
+            if b':' in line:
+                key, value = line.split(b':', 1)
+                header_info[key.strip().decode('utf-8', 'replace')] = value.strip().decode('utf-8', 'replace')
+            elif line:
+                # Store lines without colons as general info
+                if 'general_info' not in header_info:
+                    header_info['general_info'] = []
+                header_info['general_info'].append(line.decode('utf-8', 'replace'))
         
         return header_info
         
@@ -6,30 +6,86 @@ Creates vector embeddings for ClinVar data and clinical knowledge.
 
 import duckdb
 import chromadb
+import pyarrow as pa
+import pyarrow.compute as pc
 import os
 import logging
 import httpx
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import json
+import orjson
 import hashlib
+from cachetools import LRUCache
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "e5-small-v2"
+
+# Embedded documents are written to Chroma in slabs of at least this many
+CHROMA_ADD_SIZE = 2048
+
+def content_hash(text: str) -> str:
+    """Cache key for a document text in embeddings_cache (not a security hash)."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+# (column, text before the value, max characters) for ClinVar documents
+CLINVAR_DOCUMENT_PARTS = [
+    ('rsid', "Variant ", None),
+    ('gene_symbol', "in gene ", None),
+    ('clinical_significance', "has clinical significance: ", None),
+    ('condition_name', "associated with condition: ", 200),  # Truncate long conditions
+    ('molecular_consequence', "molecular consequence: ", None),
+    ('review_status', "review status: ", None),
+]
+
+def build_clinvar_documents(batch: pa.RecordBatch) -> pa.Array:
+    """
+    Build ClinVar document texts for a whole record batch with Arrow kernels.
+    
+    Each present, non-empty field contributes its prefixed phrase and the
+    phrases are joined with spaces, with no per-row Python work.
+    """
+    parts = []
+    for column, prefix, max_length in CLINVAR_DOCUMENT_PARTS:
+        values = batch.column(column).cast(pa.string())
+        if max_length is not None:
+            values = pc.utf8_slice_codeunits(values, 0, max_length)
+        present = pc.and_(pc.is_valid(values), pc.not_equal(values, ""))
+        parts.append(pc.if_else(present, pc.binary_join_element_wise(prefix, values, ""), None))
+    
+    return pc.binary_join_element_wise(*parts, " ", null_handling='skip')
+
 class EmbeddingsBuilder:
-    def __init__(self, db_path: str, chroma_path: str, llm_service_url: str):
+    def __init__(self, db_path: str, chroma_path: str, llm_service_url: str,
+                 max_concurrency: int = 8, batch_size: int = 512):
         self.db_path = db_path
         self.chroma_path = chroma_path
         self.llm_service_url = llm_service_url
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
         self.chroma_client = None
         self.collection = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._duck: Optional[duckdb.DuckDBPyConnection] = None
+        # Embedded documents waiting for the next collection.upsert
+        self._pending: Dict[str, list] = {'documents': [], 'metadatas': [], 'ids': [], 'embeddings': []}
+        # Recently used embeddings by content hash, ahead of the DuckDB cache
+        self._mem_cache: LRUCache = LRUCache(maxsize=10000)
         
     async def initialize(self):
         """Initialize connections."""
         logger.info("Initializing embeddings builder...")
         
+        # One client for every embedding request so connections are reused
+        self._client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+        )
+        
+        # One DuckDB connection for the embedding cache and ClinVar reads
+        self._duck = duckdb.connect(self.db_path)
+        
         # Initialize Chroma
         self.chroma_client = chromadb.PersistentClient(path=self.chroma_path)
         
@@ -44,11 +100,21 @@ class EmbeddingsBuilder:
             )
             logger.info("Created new genomic_knowledge collection")
     
+    async def aclose(self):
+        """Close the shared HTTP client and DuckDB connection."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._duck is not None:
+            self._duck.close()
+            self._duck = None
+    
     async def build_clinvar_embeddings(self):
         """Build embeddings for ClinVar data."""
         logger.info("Building ClinVar embeddings...")
         
-        conn = duckdb.connect(self.db_path)
+        # Own cursor so the streaming read is independent of cache queries
+        conn = self._duck.cursor()
         
         # Get ClinVar variants with meaningful clinical significance
         query = """
@@ -61,89 +127,130 @@ class EmbeddingsBuilder:
         ORDER BY rsid
         """
         
-        results = conn.execute(query).fetchall()
-        columns = [desc[0] for desc in conn.description]
+        total = conn.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0]
+        logger.info(f"Processing {total:,} ClinVar variants...")
         
-        logger.info(f"Processing {len(results):,} ClinVar variants...")
+        # Stream columnar batches instead of materializing every row as a tuple
+        reader = conn.execute(query).fetch_record_batch(rows_per_batch=self.batch_size)
         
-        batch_size = 100
+        # Three stages joined by bounded queues so DuckDB reads, embedding
+        # requests and Chroma writes overlap; a full queue pauses the stage
+        # feeding it. DuckDB and Chroma calls run on executor threads.
+        loop = asyncio.get_running_loop()
+        batches: asyncio.Queue = asyncio.Queue(maxsize=4)
+        embedded: asyncio.Queue = asyncio.Queue(maxsize=8)
         processed = 0
         
-        for i in range(0, len(results), batch_size):
-            batch = results[i:i+batch_size]
-            await self.process_clinvar_batch(batch, columns)
-            processed += len(batch)
-            
-            if processed % 1000 == 0:
-                logger.info(f"Processed {processed:,} ClinVar variants")
+        async def produce():
+            try:
+                while True:
+                    batch = await loop.run_in_executor(None, next, reader, None)
+                    if batch is None:
+                        break
+                    await batches.put(batch)
+            finally:
+                for _ in range(self.max_concurrency):
+                    await batches.put(None)
+        
+        async def embed():
+            while True:
+                batch = await batches.get()
+                if batch is None:
+                    break
+                await embedded.put((batch.num_rows, await self.embed_clinvar_batch(batch)))
         
-        conn.close()
+        async def embed_all():
+            try:
+                await asyncio.gather(*(embed() for _ in range(self.max_concurrency)))
+            finally:
+                await embedded.put(None)
+        
+        async def write():
+            nonlocal processed
+            written_batches = 0
+            while True:
+                item = await embedded.get()
+                if item is None:
+                    break
+                num_rows, result = item
+                if result is not None:
+                    await loop.run_in_executor(None, self.add_batch, *result)
+                processed += num_rows
+                written_batches += 1
+                if written_batches % 16 == 0:
+                    logger.info(f"Processed {processed:,} ClinVar variants")
+            await loop.run_in_executor(None, self._flush, 0)
+        
+        try:
+            await asyncio.gather(produce(), embed_all(), write())
+        finally:
+            conn.close()
         logger.info(f"ClinVar embeddings completed. Total: {processed:,}")
     
-    async def process_clinvar_batch(self, batch: List, columns: List[str]):
+    async def process_clinvar_batch(self, batch: pa.RecordBatch):
         """Process a batch of ClinVar variants."""
+        result = await self.embed_clinvar_batch(batch)
+        if result is not None:
+            self.add_batch(*result)
+            self._flush(0)
+    
+    async def embed_clinvar_batch(
+        self, batch: pa.RecordBatch
+    ) -> Optional[Tuple[List[str], List[Dict[str, Any]], List[str], List[List[float]]]]:
+        """Build documents for a batch of ClinVar variants and embed them."""
         try:
-            documents = []
-            metadatas = []
-            ids = []
+            # Create document text for embedding
+            documents = build_clinvar_documents(batch).to_pylist()
+            
+            # Create metadata, converting each column to Python once
+            rsids = batch.column('rsid').to_pylist()
+            gene_symbols = batch.column('gene_symbol').fill_null("").to_pylist()
+            significances = batch.column('clinical_significance').fill_null("").to_pylist()
+            conditions = pc.utf8_slice_codeunits(batch.column('condition_name'), 0, 100).fill_null("").to_pylist()
             
-            for row in batch:
-                variant_dict = dict(zip(columns, row))
-                
-                # Create document text for embedding
-                doc_text = self.create_clinvar_document(variant_dict)
-                documents.append(doc_text)
-                
-                # Create metadata
-                metadata = {
+            metadatas = [
+                {
                     'type': 'clinvar_variant',
-                    'rsid': variant_dict['rsid'],
-                    'gene_symbol': variant_dict.get('gene_symbol', ''),
-                    'clinical_significance': variant_dict.get('clinical_significance', ''),
-                    'condition': variant_dict.get('condition_name', '')[:100] if variant_dict.get('condition_name') else '',
+                    'rsid': rsid,
+                    'gene_symbol': gene_symbol,
+                    'clinical_significance': significance,
+                    'condition': condition,
                     'source': 'clinvar'
                 }
-                metadatas.append(metadata)
-                ids.append(f"clinvar_{variant_dict['rsid']}")
+                for rsid, gene_symbol, significance, condition in zip(rsids, gene_symbols, significances, conditions)
+            ]
+            ids = [f"clinvar_{rsid}" for rsid in rsids]
             
             # Get embeddings from LLM service
             embeddings = await self.get_embeddings(documents)
             
-            # Add to collection
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids,
-                embeddings=embeddings
-            )
+            return documents, metadatas, ids, embeddings
             
         except Exception as e:
             logger.error(f"Error processing ClinVar batch: {e}")
+            return None
     
-    def create_clinvar_document(self, variant: Dict[str, Any]) -> str:
-        """Create document text for ClinVar variant."""
-        doc_parts = []
-        
-        if variant.get('rsid'):
-            doc_parts.append(f"Variant {variant['rsid']}")
-        
-        if variant.get('gene_symbol'):
-            doc_parts.append(f"in gene {variant['gene_symbol']}")
-        
-        if variant.get('clinical_significance'):
-            doc_parts.append(f"has clinical significance: {variant['clinical_significance']}")
-        
-        if variant.get('condition_name'):
-            condition = variant['condition_name'][:200]  # Truncate long conditions
-            doc_parts.append(f"associated with condition: {condition}")
-        
-        if variant.get('molecular_consequence'):
-            doc_parts.append(f"molecular consequence: {variant['molecular_consequence']}")
-        
-        if variant.get('review_status'):
-            doc_parts.append(f"review status: {variant['review_status']}")
+    def add_batch(self, documents: List[str], metadatas: List[Dict[str, Any]],
+                  ids: List[str], embeddings: List[List[float]]):
+        """Queue embedded documents for the collection, writing once a slab is full."""
+        self._pending['documents'].extend(documents)
+        self._pending['metadatas'].extend(metadatas)
+        self._pending['ids'].extend(ids)
+        self._pending['embeddings'].extend(embeddings)
+        self._flush()
+    
+    def _flush(self, min_size: int = CHROMA_ADD_SIZE):
+        """Write queued documents in one collection.upsert if at least min_size are waiting."""
+        pending = self._pending
+        if not pending['ids'] or len(pending['ids']) < min_size:
+            return
         
-        return " ".join(doc_parts)
+        self._pending = {key: [] for key in pending}
+        try:
+            # upsert, so a rebuild refreshes existing variants instead of skipping their ids
+            self.collection.upsert(**pending)
+        except Exception as e:
+            logger.error(f"Error adding ClinVar batch: {e}")
     
     async def build_acmg_knowledge_embeddings(self):
         """Build embeddings for ACMG classification knowledge."""
@@ -207,8 +314,8 @@ class EmbeddingsBuilder:
         # Get embeddings
         embeddings = await self.get_embeddings(documents)
         
-        # Add to collection
-        self.collection.add(
+        # Add to collection, replacing entries from a previous build
+        self.collection.upsert(
             documents=documents,
             metadatas=metadatas,
             ids=ids,
@@ -218,46 +325,116 @@ class EmbeddingsBuilder:
         logger.info(f"Added {len(documents)} ACMG knowledge entries")
     
     async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings from LLM service."""
+        """
+        Get embeddings, checking the memory and DuckDB caches first.
+        
+        Repeated texts are hashed and looked up once, only texts missing from
+        both caches are sent to the LLM service, and the new embeddings are
+        cached.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        hashes = [content_hash(text) for text in unique_texts]
+        
+        found = {h: self._mem_cache[h] for h in hashes if h in self._mem_cache}
+        missing = [h for h in hashes if h not in found]
+        if missing:
+            found.update(self.lookup_cached_embeddings(missing))
+        
+        new_texts = {h: text for h, text in zip(hashes, unique_texts) if h not in found}
+        if new_texts:
+            try:
+                embeddings = await self._post_embeddings(list(new_texts.values()))
+            except Exception as e:
+                logger.error(f"Error getting embeddings: {e}")
+                # Return zero embeddings as fallback, and never cache them
+                fallback = [0.0] * 384  # e5-small-v2 has 384 dimensions
+                by_text = {text: found.get(h, fallback) for text, h in zip(unique_texts, hashes)}
+                return [by_text[text] for text in texts]
+            
+            found.update(zip(new_texts, embeddings))
+            await self.cache_embeddings_in_db(list(new_texts.values()), embeddings, list(new_texts))
+        
+        self._mem_cache.update(found)
+        by_text = {text: found[h] for text, h in zip(unique_texts, hashes)}
+        return [by_text[text] for text in texts]
+    
+    def lookup_cached_embeddings(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached embeddings for content hashes from DuckDB."""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.llm_service_url}/embeddings",
-                    json={"texts": texts}
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["embeddings"]
-                
+            # Cast to a list: the Python client cannot fetch fixed-size ARRAY columns
+            rows = self._duck.execute("""
+            SELECT content_hash, embedding::FLOAT[]
+            FROM embeddings_cache
+            WHERE content_hash IN (SELECT UNNEST(?)) AND model_name = ?
+            """, [hashes, EMBEDDING_MODEL]).fetchall()
+            return dict(rows)
+        
         except Exception as e:
-            logger.error(f"Error getting embeddings: {e}")
-            # Return zero embeddings as fallback
-            return [[0.0] * 384 for _ in texts]  # e5-small-v2 has 384 dimensions
+            logger.error(f"Error reading cached embeddings: {e}")
+            return {}
     
-    async def cache_embeddings_in_db(self, texts: List[str], embeddings: List[List[float]]):
+    async def _post_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """POST texts in one request, splitting the batch if it is too large."""
+        response = await self._client.post(
+            f"{self.llm_service_url}/embeddings",
+            content=orjson.dumps({"texts": texts}),
+            headers={"Content-Type": "application/json"}
+        )
+        
+        # Payload too large for the service; halve and retry each part
+        if response.status_code == 413 and len(texts) > 1:
+            middle = len(texts) // 2
+            first, second = await asyncio.gather(
+                self._post_embeddings(texts[:middle]),
+                self._post_embeddings(texts[middle:])
+            )
+            return first + second
+        
+        response.raise_for_status()
+        # orjson parses the float arrays much faster than response.json()
+        result = orjson.loads(response.content)
+        
+        if "embeddings" in result:
+            return result["embeddings"]
+        if "embedding" in result and len(texts) == 1:
+            return [result["embedding"]]
+        
+        # Service without batch support; embed one text per request
+        if len(texts) > 1:
+            logger.warning("Embedding service returned no batch embeddings; falling back to one text per request")
+            single = await asyncio.gather(*(self._post_embeddings([text]) for text in texts))
+            return [embedding for embeddings in single for embedding in embeddings]
+        
+        raise ValueError("Embedding service response has no embeddings")
+    
+    async def cache_embeddings_in_db(self, texts: List[str], embeddings: List[List[float]],
+                                     hashes: Optional[List[str]] = None):
         """Cache embeddings in database for future use."""
-        conn = duckdb.connect(self.db_path)
+        if hashes is None:
+            hashes = [content_hash(text) for text in texts]
+        
+        batch = pa.table({
+            'id': [f"embed_{text_hash}" for text_hash in hashes],
+            'content_hash': hashes,
+            'content': texts,
+            # float32 like the model output; DuckDB casts to the column type on insert
+            'embedding': pa.array(embeddings, type=pa.list_(pa.float32())),
+        })
         
         try:
-            for text, embedding in zip(texts, embeddings):
-                content_hash = hashlib.md5(text.encode()).hexdigest()
-                
-                conn.execute("""
-                INSERT OR REPLACE INTO embeddings_cache 
-                (id, content_hash, content, embedding, model_name, created_at)
-                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (
-                    f"embed_{content_hash}",
-                    content_hash,
-                    text,
-                    embedding,
-                    "e5-small-v2"
-                ))
+            # One statement for the whole batch instead of an INSERT per text
+            self._duck.register('embeddings_batch', batch)
+            self._duck.execute("""
+            INSERT OR IGNORE INTO embeddings_cache 
+            (id, content_hash, content, embedding, model_name, created_at)
+            SELECT id, content_hash, content, embedding, ?, CURRENT_TIMESTAMP
+            FROM embeddings_batch
+            """, [EMBEDDING_MODEL])
         
         except Exception as e:
             logger.error(f"Error caching embeddings: {e}")
         finally:
-            conn.close()
+            self._duck.unregister('embeddings_batch')
 
 async def main():
     """Main function for building embeddings."""
@@ -270,13 +447,19 @@ async def main():
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         os.makedirs(chroma_path, exist_ok=True)
         
+        max_concurrency = int(os.getenv("EMBED_CONCURRENCY", "8"))
+        batch_size = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+        
         # Initialize builder
-        builder = EmbeddingsBuilder(db_path, chroma_path, llm_service_url)
+        builder = EmbeddingsBuilder(db_path, chroma_path, llm_service_url, max_concurrency, batch_size)
         await builder.initialize()
         
         # Build embeddings
-        await builder.build_acmg_knowledge_embeddings()
-        await builder.build_clinvar_embeddings()
+        try:
+            await builder.build_acmg_knowledge_embeddings()
+            await builder.build_clinvar_embeddings()
+        finally:
+            await builder.aclose()
         
         logger.info("Embeddings building completed successfully!")
         
@@ -285,4 +468,6 @@ async def main():
         raise e
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main()) 
\ No newline at end of file
@@ -5,22 +5,50 @@ Downloads and processes ClinVar variant summary data.
 """
 
 import requests
-import gzip
-import pandas as pd
 import duckdb
 import os
 import logging
 from pathlib import Path
 import tempfile
+import shutil
+import threading
 from typing import Optional
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 CLINVAR_URL = "https://ftp.ncbi.nlm.nih.gov/pub/clinvar/tab_delimited/variant_summary.txt.gz"
 
-def download_clinvar_data(url: str = CLINVAR_URL, chunk_size: int = 8192) -> str:
+# Keep only variants with meaningful clinical significance
+MEANINGFUL_SIGNIFICANCE = [
+    'Pathogenic', 'Likely pathogenic', 'Benign', 'Likely benign',
+    'Uncertain significance', 'Conflicting interpretations of pathogenicity'
+]
+MEANINGFUL_SIGNIFICANCE_PATTERN = '|'.join(MEANINGFUL_SIGNIFICANCE)
+
+# clinvar_variants column -> (variant_summary column, SQL converting it); the file is
+# read as all-VARCHAR so every conversion is explicit
+CLINVAR_COLUMN_SQL = {
+    'variation_id': ('VariationID', '"VariationID"'),
+    'gene_symbol': ('GeneSymbol', 'coalesce("GeneSymbol", \'\')'),
+    'clinical_significance': ('ClinicalSignificance', '"ClinicalSignificance"'),
+    'review_status': ('ReviewStatus', '"ReviewStatus"'),
+    'condition_name': ('Condition(s)', '"Condition(s)"'),
+    # ClinVar writes 'Jun 01, 2020' and '-' for never evaluated; ISO dates are accepted too
+    'last_evaluated': (
+        'LastEvaluated',
+        'coalesce(TRY_CAST("LastEvaluated" AS DATE), try_strptime("LastEvaluated", \'%b %d, %Y\')::DATE)'
+    ),
+    'chromosome': ('Chromosome', '"Chromosome"'),
+    'start_position': ('Start', 'TRY_CAST("Start" AS UINTEGER)'),
+    # ClinVar writes 'na' for alleles it does not report
+    'reference_allele': ('ReferenceAllele', 'nullif("ReferenceAllele", \'na\')'),
+    'alternate_allele': ('AlternateAllele', 'nullif("AlternateAllele", \'na\')'),
+    'molecular_consequence': ('MolecularConsequence', '"MolecularConsequence"'),
+}
+
+RSID_COLUMN = 'RS# (dbSNP)'
+
+def download_clinvar_data(url: str = CLINVAR_URL, chunk_size: int = 1024 * 1024) -> str:
     """Download ClinVar variant summary file."""
     logger.info(f"Downloading ClinVar data from {url}")
     
@@ -28,21 +56,27 @@ def download_clinvar_data(url: str = CLINVAR_URL, chunk_size: int = 8192) -> str
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt.gz")
     
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        with open(temp_file.name, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        if downloaded % (chunk_size * 100) == 0:  # Log every ~800KB
-                            logger.info(f"Downloaded {percent:.1f}% ({downloaded:,} / {total_size:,} bytes)")
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            
+            total_size = int(response.headers.get('content-length', 0))
+            # Progress is reported from a side thread so the copy loop does no bookkeeping
+            done = threading.Event()
+            reporter = threading.Thread(
+                target=log_download_progress,
+                args=(temp_file.name, total_size, done),
+                daemon=True
+            )
+            reporter.start()
+            
+            try:
+                # Undo any Content-Encoding, as iter_content did
+                response.raw.decode_content = True
+                with open(temp_file.name, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=chunk_size)
+            finally:
+                done.set()
+                reporter.join()
         
         logger.info(f"Download completed: {temp_file.name}")
         return temp_file.name
@@ -53,44 +87,76 @@ def download_clinvar_data(url: str = CLINVAR_URL, chunk_size: int = 8192) -> str
             os.unlink(temp_file.name)
         raise e
 
+def log_download_progress(path: str, total_size: int, done: threading.Event, interval: float = 5.0):
+    """Log the size of a file being downloaded every few seconds until done is set."""
+    while not done.wait(interval):
+        downloaded = os.path.getsize(path)
+        if total_size > 0:
+            percent = (downloaded / total_size) * 100
+            logger.info(f"Downloaded {percent:.1f}% ({downloaded:,} / {total_size:,} bytes)")
+        else:
+            logger.info(f"Downloaded {downloaded:,} bytes")
+
 def process_clinvar_data(file_path: str, db_path: str) -> int:
-    """Process and insert ClinVar data into database."""
+    """
+    Load ClinVar variant summary data into the database.
+    
+    DuckDB reads the gzipped TSV itself and filters, converts and upserts it
+    in one INSERT ... SELECT, so rows never pass through Python.
+    """
     logger.info("Processing ClinVar data...")
     
     try:
-        # Read compressed file
-        with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-            # Read in chunks to manage memory
-            chunk_size = 10000
-            processed_rows = 0
+        conn = duckdb.connect(db_path)
+        
+        try:
+            source = "read_csv(?, delim='\\t', header=true, all_varchar=true, compression='gzip')"
+            available = {
+                row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {source}", [file_path]).fetchall()
+            }
+            if RSID_COLUMN not in available or 'ClinicalSignificance' not in available:
+                logger.warning("ClinVar file has no rsID or clinical significance column; nothing to load")
+                return 0
             
-            # Connect to database
-            conn = duckdb.connect(db_path)
-            
-            # Read first chunk to get column names
-            df_chunk = pd.read_csv(f, sep='\t', chunksize=chunk_size, low_memory=False, nrows=chunk_size)
-            first_chunk = next(df_chunk)
-            
-            # Reset file pointer
-            f.seek(0)
+            columns = ['rsid'] + [
+                column for column, (source_column, _) in CLINVAR_COLUMN_SQL.items()
+                if source_column in available
+            ]
+            select_str = ',\n'.join(
+                [f"'rs' || TRY_CAST(\"{RSID_COLUMN}\" AS BIGINT)"] +
+                [CLINVAR_COLUMN_SQL[column][1] for column in columns[1:]]
+            )
+            columns_str = ', '.join(columns)
+            # Upsert on the rsid primary key
+            updates_str = ', '.join(f"{col} = EXCLUDED.{col}" for col in columns[1:] + ['cached_at'])
             
-            # Process in chunks
-            for chunk_num, df in enumerate(pd.read_csv(f, sep='\t', chunksize=chunk_size, low_memory=False)):
-                if chunk_num % 10 == 0:
-                    logger.info(f"Processing chunk {chunk_num}, rows: {processed_rows:,}")
-                
-                # Filter and process relevant columns
-                processed_df = process_clinvar_chunk(df)
-                
-                if not processed_df.empty:
-                    # Insert into database using UPSERT pattern
-                    insert_clinvar_batch(conn, processed_df)
-                    processed_rows += len(processed_df)
+            # ClinVar lists an rsID once per assembly and allele; keep one row per
+            # rsID, preferring GRCh38 and then the newest VariationID
+            preference = []
+            if 'Assembly' in available:
+                preference.append("(\"Assembly\" = 'GRCh38') DESC")
+            if 'VariationID' in available:
+                preference.append("TRY_CAST(\"VariationID\" AS BIGINT) DESC")
+            order_str = f"ORDER BY {', '.join(preference)}" if preference else ""
             
+            processed_rows = conn.execute(f"""
+            INSERT INTO clinvar_variants ({columns_str}, cached_at)
+            SELECT {select_str},
+            CURRENT_TIMESTAMP
+            FROM {source}
+            WHERE TRY_CAST("{RSID_COLUMN}" AS BIGINT) <> -1
+            AND regexp_matches("ClinicalSignificance", ?, 'i')
+            QUALIFY row_number() OVER (
+                PARTITION BY TRY_CAST("{RSID_COLUMN}" AS BIGINT) {order_str}
+            ) = 1
+            ON CONFLICT (rsid) DO UPDATE SET {updates_str}
+            """, [file_path, MEANINGFUL_SIGNIFICANCE_PATTERN]).fetchone()[0]
+        finally:
             conn.close()
-            logger.info(f"ClinVar processing completed. Total rows processed: {processed_rows:,}")
-            return processed_rows
-            
+        
+        logger.info(f"ClinVar processing completed. Total rows processed: {processed_rows:,}")
+        return processed_rows
+        
     except Exception as e:
         logger.error(f"Error processing ClinVar data: {e}")
         raise e
@@ -99,100 +165,6 @@ def process_clinvar_data(file_path: str, db_path: str) -> int:
         if os.path.exists(file_path):
             os.unlink(file_path)
 
-def process_clinvar_chunk(df: pd.DataFrame) -> pd.DataFrame:
-    """Process a chunk of ClinVar data."""
-    try:
-        # Select relevant columns (adjust based on actual ClinVar format)
-        relevant_columns = [
-            'RS# (dbSNP)', 'VariationID', 'GeneSymbol', 'ClinicalSignificance',
-            'ReviewStatus', 'Condition(s)', 'LastEvaluated', 'Chromosome', 
-            'Start', 'ReferenceAllele', 'AlternateAllele', 'Assembly',
-            'Cytogenetic', 'MolecularConsequence'
-        ]
-        
-        # Keep only columns that exist in the dataframe
-        available_columns = [col for col in relevant_columns if col in df.columns]
-        df_filtered = df[available_columns].copy()
-        
-        # Filter for variants with rsIDs
-        if 'RS# (dbSNP)' in df_filtered.columns:
-            df_filtered = df_filtered[df_filtered['RS# (dbSNP)'].notna()]
-            df_filtered = df_filtered[df_filtered['RS# (dbSNP)'] != -1]
-            
-            # Convert rsID to string format (rs123456)
-            df_filtered['rsid'] = 'rs' + df_filtered['RS# (dbSNP)'].astype(str)
-        else:
-            # If no rsID column, return empty dataframe
-            return pd.DataFrame()
-        
-        # Rename columns to match database schema
-        column_mapping = {
-            'VariationID': 'variation_id',
-            'GeneSymbol': 'gene_symbol',
-            'ClinicalSignificance': 'clinical_significance',
-            'ReviewStatus': 'review_status',
-            'Condition(s)': 'condition_name',
-            'LastEvaluated': 'last_evaluated',
-            'Chromosome': 'chromosome',
-            'Start': 'start_position',
-            'ReferenceAllele': 'reference_allele',
-            'AlternateAllele': 'alternate_allele',
-            'MolecularConsequence': 'molecular_consequence'
-        }
-        
-        df_filtered = df_filtered.rename(columns=column_mapping)
-        
-        # Clean data
-        if 'clinical_significance' in df_filtered.columns:
-            df_filtered['clinical_significance'] = df_filtered['clinical_significance'].fillna('Unknown')
-        
-        if 'gene_symbol' in df_filtered.columns:
-            df_filtered['gene_symbol'] = df_filtered['gene_symbol'].fillna('')
-        
-        # Keep only variants with meaningful clinical significance
-        meaningful_significance = [
-            'Pathogenic', 'Likely pathogenic', 'Benign', 'Likely benign',
-            'Uncertain significance', 'Conflicting interpretations of pathogenicity'
-        ]
-        
-        if 'clinical_significance' in df_filtered.columns:
-            df_filtered = df_filtered[
-                df_filtered['clinical_significance'].str.contains(
-                    '|'.join(meaningful_significance), 
-                    case=False, 
-                    na=False
-                )
-            ]
-        
-        return df_filtered
-        
-    except Exception as e:
-        logger.error(f"Error processing ClinVar chunk: {e}")
-        return pd.DataFrame()
-
-def insert_clinvar_batch(conn: duckdb.DuckDBPyConnection, df: pd.DataFrame):
-    """Insert batch of ClinVar data into database."""
-    try:
-        # Convert DataFrame to list of tuples for insertion
-        columns = list(df.columns)
-        values = df.values.tolist()
-        
-        # Create INSERT with ON CONFLICT DO UPDATE (UPSERT)
-        placeholders = ','.join(['?' for _ in columns])
-        columns_str = ','.join(columns)
-        
-        insert_sql = f"""
-        INSERT OR REPLACE INTO clinvar_variants ({columns_str}, cached_at)
-        VALUES ({placeholders}, CURRENT_TIMESTAMP)
-        """
-        
-        # Execute batch insert
-        conn.executemany(insert_sql, values)
-        
-    except Exception as e:
-        logger.error(f"Error inserting ClinVar batch: {e}")
-        raise e
-
 def main():
     """Main function for ClinVar ingestion."""
     try:
@@ -213,4 +185,6 @@ def main():
         raise e
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(level=logging.INFO)
     main() 
\ No newline at end of file
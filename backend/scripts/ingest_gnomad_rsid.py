@@ -6,24 +6,79 @@ Downloads and processes gnomAD population frequency data.
 
 import requests
 import gzip
+import struct
+import zlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
+import pyarrow as pa
 import duckdb
 import os
 import logging
 from pathlib import Path
 import tempfile
+import shutil
+import threading
 import re
-from typing import Optional, Dict, Any
-import json
+from typing import Optional, Dict, Any, Iterator, Tuple
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Using gnomAD v3.1.2 sites VCF (smaller than genomes)
 GNOMAD_URL = "https://storage.googleapis.com/gcp-public-data--gnomad/release/3.1.2/vcf/genomes/gnomad.genomes.v3.1.2.sites.chr22.vcf.bgz"
 
-def download_gnomad_data(url: str = GNOMAD_URL, chunk_size: int = 8192) -> str:
+# Common gnomAD population frequency fields
+POPULATION_FIELDS = {
+    'AF_afr': 'African',
+    'AF_ami': 'Amish', 
+    'AF_amr': 'Latino',
+    'AF_asj': 'Ashkenazi Jewish',
+    'AF_eas': 'East Asian',
+    'AF_fin': 'Finnish',
+    'AF_nfe': 'Non-Finnish European',
+    'AF_oth': 'Other',
+    'AF_sas': 'South Asian'
+}
+
+# INFO keys parse_vcf_line reads, as ';KEY=' markers; everything else on the line is skipped
+INFO_KEY_MARKERS = [
+    (key, f';{key}=') for key in ['AF', 'AC', 'AN', 'nhomalt', *POPULATION_FIELDS]
+]
+
+# rsID carried in the INFO field when the ID column has none
+RS_INFO_PATTERN = re.compile(r'RS=(\d+)')
+
+# BGZF members are gzip members with a 'BC' extra subfield holding the block size
+BGZF_HEADER = struct.Struct('<4BI2BH')
+BGZF_SUBFIELD = struct.Struct('<2BH')
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+DECOMPRESS_WORKERS = os.cpu_count() or 1
+READ_SIZE = 1 << 20
+
+# VCF text handed to each parse worker, split on line boundaries
+PARSE_BUFFER_SIZE = 4 << 20
+PARSE_WORKERS = int(os.getenv("GNOMAD_PARSE_WORKERS", str(max((os.cpu_count() or 1) - 1, 1))))
+
+# gnomad_frequencies columns filled from parse_vcf_line (population_frequencies
+# and cached_at are set on insert)
+GNOMAD_TABLE_COLUMNS = [
+    'rsid', 'chromosome', 'position', 'reference_allele', 'alternate_allele',
+    'allele_frequency', 'allele_count', 'allele_number', 'homozygote_count'
+] + [field.lower() for field in POPULATION_FIELDS]
+
+# population_frequencies JSON built from the af_* columns inside DuckDB, keeping
+# only the populations that have a value
+POPULATION_FREQUENCIES_SQL = (
+    "to_json(map_from_entries(list_filter(["
+    + ", ".join(
+        f"{{'key': '{population}', 'value': {field.lower()}}}"
+        for field, population in POPULATION_FIELDS.items()
+    )
+    + "], entry -> entry.value IS NOT NULL)))"
+)
+
+def download_gnomad_data(url: str = GNOMAD_URL, chunk_size: int = 1024 * 1024) -> str:
     """Download gnomAD frequency file (using chr22 for demo/testing)."""
     logger.info(f"Downloading gnomAD data from {url}")
     
@@ -31,21 +86,27 @@ def download_gnomad_data(url: str = GNOMAD_URL, chunk_size: int = 8192) -> str:
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".vcf.bgz")
     
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        with open(temp_file.name, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        if downloaded % (chunk_size * 100) == 0:  # Log every ~800KB
-                            logger.info(f"Downloaded {percent:.1f}% ({downloaded:,} / {total_size:,} bytes)")
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            
+            total_size = int(response.headers.get('content-length', 0))
+            # Progress is reported from a side thread so the copy loop does no bookkeeping
+            done = threading.Event()
+            reporter = threading.Thread(
+                target=log_download_progress,
+                args=(temp_file.name, total_size, done),
+                daemon=True
+            )
+            reporter.start()
+            
+            try:
+                # Undo any Content-Encoding, as iter_content did
+                response.raw.decode_content = True
+                with open(temp_file.name, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=chunk_size)
+            finally:
+                done.set()
+                reporter.join()
         
         logger.info(f"Download completed: {temp_file.name}")
         return temp_file.name
@@ -56,6 +117,16 @@ def download_gnomad_data(url: str = GNOMAD_URL, chunk_size: int = 8192) -> str:
             os.unlink(temp_file.name)
         raise e
 
+def log_download_progress(path: str, total_size: int, done: threading.Event, interval: float = 5.0):
+    """Log the size of a file being downloaded every few seconds until done is set."""
+    while not done.wait(interval):
+        downloaded = os.path.getsize(path)
+        if total_size > 0:
+            percent = (downloaded / total_size) * 100
+            logger.info(f"Downloaded {percent:.1f}% ({downloaded:,} / {total_size:,} bytes)")
+        else:
+            logger.info(f"Downloaded {downloaded:,} bytes")
+
 def process_gnomad_vcf(file_path: str, db_path: str) -> int:
     """Process gnomAD VCF file and extract frequency data."""
     logger.info("Processing gnomAD VCF data...")
@@ -64,34 +135,15 @@ def process_gnomad_vcf(file_path: str, db_path: str) -> int:
         processed_rows = 0
         conn = duckdb.connect(db_path)
         
-        # Process VCF file line by line (it's compressed)
-        with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-            batch_size = 1000
-            batch_data = []
+        # Lines are parsed in worker processes; this process only inserts
+        lines_read = 0
+        for line_count, variant_count, batch in iter_parsed_buffers(file_path):
+            lines_read += line_count
+            logger.info(f"Processed {lines_read:,} lines")
             
-            for line_num, line in enumerate(f):
-                if line_num % 10000 == 0:
-                    logger.info(f"Processing line {line_num:,}")
-                
-                # Skip header lines
-                if line.startswith('#'):
-                    continue
-                
-                # Parse VCF line
-                variant_data = parse_vcf_line(line)
-                if variant_data:
-                    batch_data.append(variant_data)
-                    
-                    # Insert batch when full
-                    if len(batch_data) >= batch_size:
-                        insert_gnomad_batch(conn, batch_data)
-                        processed_rows += len(batch_data)
-                        batch_data = []
-            
-            # Insert remaining data
-            if batch_data:
-                insert_gnomad_batch(conn, batch_data)
-                processed_rows += len(batch_data)
+            if batch.num_rows:
+                insert_gnomad_table(conn, batch)
+                processed_rows += variant_count
         
         conn.close()
         logger.info(f"gnomAD processing completed. Total variants processed: {processed_rows:,}")
@@ -105,10 +157,135 @@ def process_gnomad_vcf(file_path: str, db_path: str) -> int:
         if os.path.exists(file_path):
             os.unlink(file_path)
 
+def read_bgzf_blocks(file_path: str) -> Iterator[bytes]:
+    """Yield the raw compressed members of a BGZF file, raising ValueError if it is not BGZF."""
+    with open(file_path, 'rb') as f:
+        while True:
+            header = f.read(BGZF_HEADER.size)
+            if not header:
+                return
+            if len(header) < BGZF_HEADER.size:
+                raise ValueError("Truncated BGZF block header")
+            
+            id1, id2, _, flags, _, _, _, extra_len = BGZF_HEADER.unpack(header)
+            if (id1, id2) != (31, 139) or not flags & 4:
+                raise ValueError("Not a BGZF file")
+            
+            extra = f.read(extra_len)
+            block_size = None
+            offset = 0
+            while offset + BGZF_SUBFIELD.size <= extra_len:
+                si1, si2, field_len = BGZF_SUBFIELD.unpack_from(extra, offset)
+                if (si1, si2) == (66, 67):  # 'BC'
+                    block_size = struct.unpack_from('<H', extra, offset + 4)[0] + 1
+                offset += BGZF_SUBFIELD.size + field_len
+            if block_size is None:
+                raise ValueError("Not a BGZF file")
+            
+            body = f.read(block_size - BGZF_HEADER.size - extra_len)
+            yield header + extra + body
+
+def is_bgzf(file_path: str) -> bool:
+    """Check whether the file starts with a BGZF block."""
+    try:
+        next(read_bgzf_blocks(file_path), None)
+        return True
+    except ValueError:
+        return False
+
+def iter_decompressed_chunks(file_path: str) -> Iterator[bytes]:
+    """
+    Yield the decompressed contents of a gzip/BGZF file in order.
+    
+    BGZF blocks are independent gzip members, so they are inflated on a
+    thread pool (zlib releases the GIL) with a bounded read-ahead. Plain
+    gzip files fall back to large sequential reads.
+    """
+    if not is_bgzf(file_path):
+        with gzip.open(file_path, 'rb') as f:
+            yield from iter(lambda: f.read(READ_SIZE), b'')
+        return
+    
+    max_pending = DECOMPRESS_WORKERS * 4
+    with ThreadPoolExecutor(max_workers=DECOMPRESS_WORKERS) as executor:
+        pending = deque()
+        for block in read_bgzf_blocks(file_path):
+            pending.append(executor.submit(zlib.decompress, block, GZIP_WBITS))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_vcf_buffers(file_path: str, buffer_size: int = PARSE_BUFFER_SIZE) -> Iterator[bytes]:
+    """Yield the decompressed VCF as runs of complete lines of roughly buffer_size bytes."""
+    remainder = b''
+    pending = []
+    pending_size = 0
+    for chunk in iter_decompressed_chunks(file_path):
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size < buffer_size:
+            continue
+        
+        data = remainder + b''.join(pending)
+        cut = data.rfind(b'\n') + 1
+        remainder = data[cut:]
+        pending = []
+        pending_size = 0
+        if cut:
+            yield data[:cut]
+    
+    data = remainder + b''.join(pending)
+    if data:
+        yield data
+
+def parse_vcf_buffer(buffer: bytes) -> Tuple[int, int, pa.Table]:
+    """Parse a run of VCF lines into a gnomad_frequencies batch (line count, variant count, table)."""
+    variants = []
+    lines = buffer.decode('utf-8').split('\n')
+    for line in lines:
+        # Skip header lines
+        if not line or line.startswith('#'):
+            continue
+        
+        variant_data = parse_vcf_line(line)
+        if variant_data:
+            variants.append(variant_data)
+    
+    return buffer.count(b'\n'), len(variants), gnomad_batch_table(variants)
+
+def iter_parsed_buffers(file_path: str) -> Iterator[Tuple[int, int, pa.Table]]:
+    """
+    Parse the VCF on a process pool, yielding results in file order.
+    
+    At most a few buffers per worker are in flight, so memory stays bounded
+    however far parsing falls behind decompression. Workers are spawned
+    rather than forked because the decompression threads are already running.
+    With a single worker the buffers are parsed in-process instead.
+    """
+    if PARSE_WORKERS <= 1:
+        for buffer in iter_vcf_buffers(file_path):
+            yield parse_vcf_buffer(buffer)
+        return
+    
+    max_pending = PARSE_WORKERS * 2
+    with ProcessPoolExecutor(
+        max_workers=PARSE_WORKERS,
+        mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        pending = deque()
+        for buffer in iter_vcf_buffers(file_path):
+            pending.append(executor.submit(parse_vcf_buffer, buffer))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 def parse_vcf_line(line: str) -> Optional[Dict[str, Any]]:
     """Parse a single VCF line and extract relevant frequency data."""
     try:
-        fields = line.strip().split('\t')
+        # INFO is the 8th column; leave any sample columns unsplit
+        fields = line.strip().split('\t', 8)
         if len(fields) < 8:
             return None
         
@@ -125,7 +302,7 @@ def parse_vcf_line(line: str) -> Optional[Dict[str, Any]]:
             rsid = variant_id
         else:
             # Look for rsID in INFO field
-            rs_match = re.search(r'RS=(\d+)', info)
+            rs_match = RS_INFO_PATTERN.search(info)
             if rs_match:
                 rsid = f"rs{rs_match.group(1)}"
         
@@ -134,7 +311,7 @@ def parse_vcf_line(line: str) -> Optional[Dict[str, Any]]:
             return None
         
         # Parse INFO field for frequency data
-        info_dict = parse_info_field(info)
+        info_dict = extract_info_fields(info)
         
         # Extract allele frequency
         af = info_dict.get('AF', 0.0)
@@ -154,58 +331,60 @@ def parse_vcf_line(line: str) -> Optional[Dict[str, Any]]:
             'allele_frequency': float(af) if af else 0.0,
             'allele_count': int(ac) if ac else 0,
             'allele_number': int(an) if an else 0,
-            'homozygote_count': int(nhomalt) if nhomalt else 0,
-            'population_frequencies': json.dumps(pop_frequencies)
+            'homozygote_count': int(nhomalt) if nhomalt else 0
         }
         
+        # Numeric per-population columns (af_afr, af_ami, ...)
+        for field, population in POPULATION_FIELDS.items():
+            variant_data[field.lower()] = pop_frequencies.get(population)
+        
         return variant_data
         
     except Exception as e:
         logger.debug(f"Error parsing VCF line: {e}")
         return None
 
-def parse_info_field(info: str) -> Dict[str, Any]:
-    """Parse VCF INFO field into dictionary."""
+def extract_info_fields(info: str) -> Dict[str, Any]:
+    """
+    Parse only the INFO_KEY_MARKERS entries of a VCF INFO field into a dictionary.
+    
+    gnomAD lines carry hundreds of INFO keys, so each wanted key is located
+    with a substring search instead of splitting and converting them all.
+    """
+    info = ';' + info
     info_dict = {}
     
-    for item in info.split(';'):
-        if '=' in item:
-            key, value = item.split('=', 1)
-            # Try to convert to appropriate type
-            try:
-                if ',' in value:
-                    # Multiple values
-                    info_dict[key] = [float(v) if '.' in v else int(v) for v in value.split(',')]
-                elif '.' in value:
-                    info_dict[key] = float(value)
-                else:
-                    info_dict[key] = int(value)
-            except ValueError:
-                info_dict[key] = value
-        else:
-            # Flag field
-            info_dict[item] = True
+    for key, marker in INFO_KEY_MARKERS:
+        # Last occurrence wins, as when every item was parsed into a dict
+        start = info.rfind(marker)
+        if start < 0:
+            continue
+        start += len(marker)
+        end = info.find(';', start)
+        value = info[start:end] if end >= 0 else info[start:]
+        # Plain counts (AC, AN, nhomalt) need no fallback
+        info_dict[key] = int(value) if value.isdecimal() else parse_info_value(value)
     
     return info_dict
 
+def parse_info_value(value: str) -> Any:
+    """Convert an INFO value to int, float or a list of them, else keep the string."""
+    try:
+        if ',' in value:
+            # Multiple values
+            return [float(v) if '.' in v else int(v) for v in value.split(',')]
+        elif '.' in value:
+            return float(value)
+        else:
+            return int(value)
+    except ValueError:
+        return value
+
 def extract_population_frequencies(info_dict: Dict[str, Any]) -> Dict[str, float]:
     """Extract population-specific frequencies from INFO field."""
     pop_frequencies = {}
     
-    # Common gnomAD population frequency fields
-    population_fields = {
-        'AF_afr': 'African',
-        'AF_ami': 'Amish', 
-        'AF_amr': 'Latino',
-        'AF_asj': 'Ashkenazi Jewish',
-        'AF_eas': 'East Asian',
-        'AF_fin': 'Finnish',
-        'AF_nfe': 'Non-Finnish European',
-        'AF_oth': 'Other',
-        'AF_sas': 'South Asian'
-    }
-    
-    for field, population in population_fields.items():
+    for field, population in POPULATION_FIELDS.items():
         if field in info_dict:
             freq = info_dict[field]
             if isinstance(freq, list) and freq:
@@ -215,34 +394,39 @@ def extract_population_frequencies(info_dict: Dict[str, Any]) -> Dict[str, float
     
     return pop_frequencies
 
+def gnomad_batch_table(batch_data: list) -> pa.Table:
+    """Build an Arrow table of GNOMAD_TABLE_COLUMNS from parsed variants, one row per rsID."""
+    # The last one wins as with row-by-row upserts
+    unique_variants = list({variant['rsid']: variant for variant in batch_data}.values())
+    return pa.Table.from_pydict({
+        column: [variant[column] for variant in unique_variants]
+        for column in GNOMAD_TABLE_COLUMNS
+    })
+
 def insert_gnomad_batch(conn: duckdb.DuckDBPyConnection, batch_data: list):
     """Insert batch of gnomAD data into database."""
+    insert_gnomad_table(conn, gnomad_batch_table(batch_data))
+
+def insert_gnomad_table(conn: duckdb.DuckDBPyConnection, batch: pa.Table):
+    """Insert an Arrow table from gnomad_batch_table into gnomad_frequencies."""
     try:
-        # Prepare data for insertion
-        values = []
-        for variant in batch_data:
-            values.append((
-                variant['rsid'],
-                variant['chromosome'],
-                variant['position'],
-                variant['reference_allele'],
-                variant['alternate_allele'],
-                variant['allele_frequency'],
-                variant['allele_count'],
-                variant['allele_number'],
-                variant['homozygote_count'],
-                variant['population_frequencies']
-            ))
-        
-        insert_sql = """
-        INSERT OR REPLACE INTO gnomad_frequencies 
-        (rsid, chromosome, position, reference_allele, alternate_allele, 
-         allele_frequency, allele_count, allele_number, homozygote_count, 
-         population_frequencies, cached_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """
+        columns_str = ', '.join(GNOMAD_TABLE_COLUMNS)
+        # Upsert on the rsid primary key
+        updates_str = ', '.join(
+            f"{column} = EXCLUDED.{column}"
+            for column in GNOMAD_TABLE_COLUMNS[1:] + ['population_frequencies', 'cached_at']
+        )
         
-        conn.executemany(insert_sql, values)
+        # Scan the Arrow table directly instead of binding parameters row by row
+        conn.register('gnomad_batch', batch)
+        try:
+            conn.execute(f"""
+            INSERT INTO gnomad_frequencies ({columns_str}, population_frequencies, cached_at)
+            SELECT {columns_str}, {POPULATION_FREQUENCIES_SQL}, CURRENT_TIMESTAMP FROM gnomad_batch
+            ON CONFLICT (rsid) DO UPDATE SET {updates_str}
+            """)
+        finally:
+            conn.unregister('gnomad_batch')
         
     except Exception as e:
         logger.error(f"Error inserting gnomAD batch: {e}")
@@ -268,4 +452,6 @@ def main():
         raise e
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(level=logging.INFO)
     main() 
\ No newline at end of file
@@ -4,15 +4,122 @@ Database initialization script for Genomic-LLM.
 Creates all necessary tables and indexes for production.
 """
 
+import argparse
 import duckdb
 import os
 import logging
 from pathlib import Path
+from typing import Dict
+from app.services.db_bulk import create_hot_views
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Numeric gnomAD population columns and their keys in population_frequencies
+POPULATION_COLUMNS = {
+    'af_afr': 'African',
+    'af_ami': 'Amish',
+    'af_amr': 'Latino',
+    'af_asj': 'Ashkenazi Jewish',
+    'af_eas': 'East Asian',
+    'af_fin': 'Finnish',
+    'af_nfe': 'Non-Finnish European',
+    'af_oth': 'Other',
+    'af_sas': 'South Asian'
+}
+
+# Dictionary-encoded types for low-cardinality columns; the values must match
+# what the application writes (app.models.schemas, variant_parser.CHROMOSOME_ORDER).
+# ClinVar significance and review status stay VARCHAR as they are open-ended text.
+ENUM_TYPES = {
+    'acmg_class_t': [
+        'Patogênica', 'Provavelmente Patogênica', 'VUS', 'Provavelmente Benigna', 'Benigna'
+    ],
+    'chromosome_t': [str(i) for i in range(1, 23)] + ['X', 'Y', 'MT'],
+    'status_t': ['uploaded', 'pending', 'processing', 'generating', 'completed', 'error'],
+    'report_type_t': ['standard', 'detailed'],
+    'language_t': ['pt-BR', 'en'],
+}
+
+def create_enum_types(conn: duckdb.DuckDBPyConnection):
+    """Create the ENUM types used by the schema; DuckDB has no CREATE TYPE IF NOT EXISTS."""
+    existing = {row[0] for row in conn.execute("SELECT type_name FROM duckdb_types()").fetchall()}
+    for type_name, values in ENUM_TYPES.items():
+        if type_name not in existing:
+            values_str = ', '.join(f"'{value}'" for value in values)
+            conn.execute(f"CREATE TYPE {type_name} AS ENUM ({values_str})")
+
+def archive_variant_results(conn: duckdb.DuckDBPyConnection, directory: str):
+    """Export variant_results as Parquet, one directory per analysis_id."""
+    target = directory.replace("'", "''")
+    conn.execute(f"""
+    COPY (SELECT * FROM variant_results ORDER BY analysis_id, chromosome, position)
+    TO '{target}' (FORMAT PARQUET, PARTITION_BY (analysis_id), OVERWRITE_OR_IGNORE true)
+    """)
+    logger.info(f"Archived variant_results to {directory}")
+
+# Indexes earlier versions created: three duplicate the PRIMARY KEY/UNIQUE index
+# on the same column, variant_results is never looked up by rsid, and the
+# low-cardinality analysis_id/classification indexes made every bulk insert
+# crawl; idx_variant_results_analysis_class replaces them. Nothing filters
+# uploads or analyses by status, and DuckDB runs an UPDATE of an indexed
+# column as delete + insert, which fails on the primary key; it also parses
+# but ignores the WHERE of a partial index, so those cannot shrink them
+REDUNDANT_INDEXES = [
+    'idx_variant_results_rsid',
+    'idx_variant_results_analysis_id',
+    'idx_variant_results_classification',
+    'idx_clinvar_variants_rsid',
+    'idx_gnomad_frequencies_rsid',
+    'idx_embeddings_cache_hash',
+    'idx_uploads_status',
+    'idx_analyses_status',
+]
+
+# Columns promoted out of chat_sessions.context
+CHAT_SESSION_COLUMNS = {
+    'last_variant_id': 'VARCHAR',
+    'turn_count': 'INTEGER DEFAULT 0',
+}
+
+def add_missing_columns(conn: duckdb.DuckDBPyConnection, table: str, columns: Dict[str, str]):
+    """Add the columns (name -> type) that a table created by an older version lacks."""
+    existing = {
+        row[0] for row in conn.execute(
+            "SELECT column_name FROM duckdb_columns() WHERE table_name = ?", [table]
+        ).fetchall()
+    }
+    # A missing table is created with every column
+    missing = [column for column in columns if column not in existing]
+    if not existing or not missing:
+        return
+    
+    # DuckDB refuses to alter a table that has indexes, so drop and recreate them
+    indexes = conn.execute(
+        "SELECT index_name, sql FROM duckdb_indexes() WHERE table_name = ?", [table]
+    ).fetchall()
+    for index_name, _ in indexes:
+        conn.execute(f"DROP INDEX {index_name}")
+    for column in missing:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {columns[column]}")
+    for _, index_sql in indexes:
+        conn.execute(index_sql)
+
+def migrate_population_frequencies(conn: duckdb.DuckDBPyConnection):
+    """Split the population_frequencies JSON into numeric af_* columns."""
+    add_missing_columns(conn, 'gnomad_frequencies', {column: 'REAL' for column in POPULATION_COLUMNS})
+    
+    # One-shot backfill of rows ingested before the numeric columns existed
+    assignments = ',\n'.join(
+        f"{column} = CAST(population_frequencies->>'{population}' AS REAL)"
+        for column, population in POPULATION_COLUMNS.items()
+    )
+    conn.execute(f"""
+    UPDATE gnomad_frequencies SET
+    {assignments}
+    WHERE population_frequencies IS NOT NULL
+    AND {' AND '.join(f'{column} IS NULL' for column in POPULATION_COLUMNS)}
+    """)
+
 def init_database(db_path: str = "/app/data/genomic.duckdb"):
     """Initialize the DuckDB database with all required tables."""
     
@@ -33,16 +140,17 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
             file_path VARCHAR NOT NULL,
             upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             file_size BIGINT,
-            status VARCHAR DEFAULT 'uploaded',  -- uploaded, processing, completed, error
+            status status_t DEFAULT 'uploaded',  -- uploaded, processing, completed, error
             user_id VARCHAR,
-            metadata JSON
+            -- Known fields typed; anything else goes in extra
+            metadata STRUCT(source VARCHAR, build VARCHAR, sample_id VARCHAR, extra JSON)
         );
 
         -- Genomic analyses table  
         CREATE TABLE IF NOT EXISTS analyses (
             id VARCHAR PRIMARY KEY,
             upload_id VARCHAR NOT NULL,
-            status VARCHAR DEFAULT 'pending',  -- pending, processing, completed, error
+            status status_t DEFAULT 'pending',  -- pending, processing, completed, error
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             completed_at TIMESTAMP,
             total_variants INTEGER,
@@ -57,17 +165,19 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
             FOREIGN KEY (upload_id) REFERENCES uploads(id)
         );
 
-        -- Individual variant results
+        -- Individual variant results; no primary or foreign key, so bulk loads
+        -- skip the ART and analyses lookups (ids are uuid4s and the analysis
+        -- row is written first by the application)
         CREATE TABLE IF NOT EXISTS variant_results (
-            id VARCHAR PRIMARY KEY,
+            id VARCHAR NOT NULL,
             analysis_id VARCHAR NOT NULL,
             rsid VARCHAR NOT NULL,
-            chromosome VARCHAR,
-            position BIGINT,
+            chromosome chromosome_t,
+            position UINTEGER,  -- largest human chromosome is ~249M bp
             reference_allele VARCHAR,
             alternate_allele VARCHAR,
             genotype VARCHAR,
-            acmg_classification VARCHAR,
+            acmg_classification acmg_class_t,
             acmg_score DOUBLE,
             confidence_score DOUBLE,
             clinical_significance VARCHAR,
@@ -76,19 +186,18 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
             clinvar_id VARCHAR,
             gnomad_frequency DOUBLE,
             interpretation TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (analysis_id) REFERENCES analyses(id)
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
 
         -- Reports table
         CREATE TABLE IF NOT EXISTS reports (
             id VARCHAR PRIMARY KEY,
             analysis_id VARCHAR NOT NULL,
-            report_type VARCHAR DEFAULT 'standard',  -- standard, detailed
-            language VARCHAR DEFAULT 'pt-BR',  -- pt-BR, en
+            report_type report_type_t DEFAULT 'standard',  -- standard, detailed
+            language language_t DEFAULT 'pt-BR',  -- pt-BR, en
             file_path VARCHAR,
             generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status VARCHAR DEFAULT 'pending',  -- pending, generating, completed, error
+            status status_t DEFAULT 'pending',  -- pending, generating, completed, error
             error_message TEXT,
             FOREIGN KEY (analysis_id) REFERENCES analyses(id)
         );
@@ -99,6 +208,8 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
             analysis_id VARCHAR,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_variant_id VARCHAR,
+            turn_count INTEGER DEFAULT 0,
             context JSON,
             FOREIGN KEY (analysis_id) REFERENCES analyses(id)
         );
@@ -125,7 +236,7 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
             condition_name TEXT,
             last_evaluated DATE,
             chromosome VARCHAR,
-            start_position BIGINT,
+            start_position UINTEGER,
             reference_allele VARCHAR,
             alternate_allele VARCHAR,
             molecular_consequence VARCHAR,
@@ -136,7 +247,7 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
         CREATE TABLE IF NOT EXISTS gnomad_frequencies (
             rsid VARCHAR PRIMARY KEY,
             chromosome VARCHAR,
-            position BIGINT,
+            position UINTEGER,
             reference_allele VARCHAR,
             alternate_allele VARCHAR,
             allele_frequency DOUBLE,
@@ -144,6 +255,15 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
             allele_number INTEGER,
             homozygote_count INTEGER,
             population_frequencies JSON,
+            af_afr REAL,
+            af_ami REAL,
+            af_amr REAL,
+            af_asj REAL,
+            af_eas REAL,
+            af_fin REAL,
+            af_nfe REAL,
+            af_oth REAL,
+            af_sas REAL,
             cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
 
@@ -152,36 +272,47 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
             id VARCHAR PRIMARY KEY,
             content_hash VARCHAR UNIQUE,
             content TEXT,
-            embedding DOUBLE[],
+            embedding FLOAT[384] NOT NULL,  -- e5-small-v2, stored at model precision
             model_name VARCHAR,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """
         
-        # Execute table creation
-        conn.executescript(create_tables_sql)
-        
         # Create indexes for performance
         indexes_sql = """
         -- Performance indexes
-        CREATE INDEX IF NOT EXISTS idx_uploads_status ON uploads(status);
         CREATE INDEX IF NOT EXISTS idx_uploads_upload_time ON uploads(upload_time);
         CREATE INDEX IF NOT EXISTS idx_analyses_upload_id ON analyses(upload_id);
-        CREATE INDEX IF NOT EXISTS idx_analyses_status ON analyses(status);
-        CREATE INDEX IF NOT EXISTS idx_variant_results_analysis_id ON variant_results(analysis_id);
-        CREATE INDEX IF NOT EXISTS idx_variant_results_rsid ON variant_results(rsid);
-        CREATE INDEX IF NOT EXISTS idx_variant_results_classification ON variant_results(acmg_classification);
+        CREATE INDEX IF NOT EXISTS idx_variant_results_analysis_class ON variant_results(analysis_id, acmg_classification, rsid);
         CREATE INDEX IF NOT EXISTS idx_reports_analysis_id ON reports(analysis_id);
         CREATE INDEX IF NOT EXISTS idx_chat_sessions_analysis_id ON chat_sessions(analysis_id);
         CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id);
-        CREATE INDEX IF NOT EXISTS idx_clinvar_variants_rsid ON clinvar_variants(rsid);
-        CREATE INDEX IF NOT EXISTS idx_gnomad_frequencies_rsid ON gnomad_frequencies(rsid);
-        CREATE INDEX IF NOT EXISTS idx_embeddings_cache_hash ON embeddings_cache(content_hash);
         """
         
-        conn.executescript(indexes_sql)
+        # All schema changes in one transaction, so the catalog is committed once
+        # and a failed migration leaves the database as it was
+        try:
+            conn.execute("BEGIN TRANSACTION")
+            create_enum_types(conn)
+            # Before the CREATE script: DuckDB will not alter a table that a
+            # foreign key created in the same transaction depends on
+            add_missing_columns(conn, 'chat_sessions', CHAT_SESSION_COLUMNS)
+            conn.execute(create_tables_sql + indexes_sql)
+            
+            # Every extra ART index is maintained on each insert
+            for index_name in REDUNDANT_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+            
+            # Bring databases created before the af_* columns up to date
+            migrate_population_frequencies(conn)
+            create_hot_views(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
         
-        conn.close()
         logger.info("Database initialized successfully!")
         
     except Exception as e:
@@ -189,5 +320,18 @@ def init_database(db_path: str = "/app/data/genomic.duckdb"):
         raise e
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Initialize the Genomic-LLM database")
+    parser.add_argument(
+        "--archive", metavar="DIR",
+        help="also export variant_results to DIR as Parquet partitioned by analysis_id"
+    )
+    args = parser.parse_args()
+    
+    # Configure logging
+    logging.basicConfig(level=logging.INFO)
     db_path = os.getenv("DUCKDB_PATH", "/app/data/genomic.duckdb")
-    init_database(db_path) 
\ No newline at end of file
+    init_database(db_path)
+    
+    if args.archive:
+        with duckdb.connect(db_path) as conn:
+            archive_variant_results(conn, args.archive) 
\ No newline at end of file
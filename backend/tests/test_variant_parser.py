@@ -0,0 +1,29 @@
+"""
+Tests for the 23andMe parser.
+"""
+
+from app.services.variant_parser import iter_23andme_variants, parse_23andme_txt
+
+MID_FILE_COMMENT_DATA = (
+    "# This data file generated by 23andMe\n"
+    "# rsid\tchromosome\tposition\tgenotype\n"
+    "rs1\t1\t100\tAA\n"
+    "# comment inside the body\n"
+    "rs2\t1\t200\tAG\n"
+    "# rsid\tchromosome\tposition\tgenotype\n"
+    "#rs3\t2\t300\tCC\n"
+    "rs4\t2\t400\tTT\n"
+)
+
+EXPECTED_VARIANTS = [
+    {'rsID': 'rs1', 'chromosome': '1', 'position': 100, 'genotype': 'AA'},
+    {'rsID': 'rs2', 'chromosome': '1', 'position': 200, 'genotype': 'AG'},
+    {'rsID': 'rs4', 'chromosome': '2', 'position': 400, 'genotype': 'TT'},
+]
+
+def test_mid_file_comments_are_skipped(tmp_path):
+    file_path = tmp_path / "genome.txt"
+    file_path.write_text(MID_FILE_COMMENT_DATA)
+
+    assert parse_23andme_txt(str(file_path)) == EXPECTED_VARIANTS
+    assert list(iter_23andme_variants(str(file_path))) == EXPECTED_VARIANTS
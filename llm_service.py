@@ -3,11 +3,15 @@ LLM Service for PubMedBERT inference and embeddings.
 """
 
 import os
-from typing import List, Dict, Any
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import orjson
 import torch
-from transformers import AutoTokenizer, AutoModel, pipeline
+from transformers import AutoTokenizer, AutoModelForCausalLM, GenerationConfig
 from sentence_transformers import SentenceTransformer
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
 import logging
 
@@ -41,12 +45,40 @@ class HealthResponse(BaseModel):
 tokenizer = None
 model = None
 embedding_model = None
-text_generator = None
+# Sampling settings shared by /generate and /analyze_variant; per-request values
+# are passed to generate as overrides
+generation_config = None
+
+# Recently requested embeddings by text, most recent last
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+_embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+# Concurrent /embeddings requests arriving within this window share one encode call
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5")) / 1000
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+_embedding_queue: Optional["asyncio.Queue[Tuple[List[str], asyncio.Future]]"] = None
+_embedding_dispatcher: Optional[asyncio.Task] = None
+
+# Run the models' Linear layers in int8 on CPU; off by default because
+# embeddings then differ slightly from those already stored
+QUANTIZE_INT8 = os.getenv("QUANTIZE_INT8", "false").lower() in ("1", "true", "yes")
+
+def quantize_int8(module: torch.nn.Module) -> torch.nn.Module:
+    """Return a copy of module with dynamically quantized int8 Linear layers."""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+# Compile the transformer forward passes with Inductor; off by default because
+# it needs a C++ compiler in the image and the first requests pay for compilation
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "false").lower() in ("1", "true", "yes")
+
+def compile_forward(module: torch.nn.Module):
+    """Replace module.forward with a torch.compile'd version that accepts any sequence length."""
+    module.forward = torch.compile(module.forward, dynamic=True)
 
 @app.on_event("startup")
 async def load_models():
     """Load models on startup."""
-    global tokenizer, model, embedding_model, text_generator
+    global tokenizer, model, embedding_model, generation_config, _embedding_queue, _embedding_dispatcher
     
     try:
         logger.info("Loading PubMedBERT tokenizer and model...")
@@ -54,16 +86,22 @@ async def load_models():
         cache_dir = "/app/models"
         
         tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
-        model = AutoModel.from_pretrained(model_name, cache_dir=cache_dir)
-        
-        # Create text generation pipeline
-        text_generator = pipeline(
-            "text-generation",
-            model=model_name,
-            tokenizer=tokenizer,
-            device=-1,  # CPU
+        # low_cpu_mem_usage skips the randomly initialised copy and memory-maps safetensors weights when the
+        # checkpoint has them
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
             torch_dtype=torch.float32,
-            model_kwargs={"cache_dir": cache_dir}
+            low_cpu_mem_usage=True
+        )
+        
+        # Called through model.generate directly rather than a text-generation pipeline
+        generation_config = GenerationConfig(
+            max_length=256,
+            temperature=0.7,
+            do_sample=True,
+            num_return_sequences=1,
+            pad_token_id=tokenizer.eos_token_id
         )
         
         logger.info("Loading embedding model...")
@@ -73,6 +111,20 @@ async def load_models():
             cache_folder=cache_dir
         )
         
+        if QUANTIZE_INT8:
+            logger.info("Quantizing models to int8...")
+            model = quantize_int8(model)
+            embedding_model = quantize_int8(embedding_model)
+        
+        if TORCH_COMPILE:
+            logger.info("Compiling model forward passes...")
+            compile_forward(model)
+            # First module of the SentenceTransformer wraps the Hugging Face model
+            compile_forward(embedding_model[0].auto_model)
+        
+        _embedding_queue = asyncio.Queue()
+        _embedding_dispatcher = asyncio.create_task(dispatch_embeddings(_embedding_queue))
+        
         logger.info("All models loaded successfully!")
         
     except Exception as e:
@@ -86,7 +138,7 @@ async def health_check():
         tokenizer is not None,
         model is not None,
         embedding_model is not None,
-        text_generator is not None
+        generation_config is not None
     ])
     
     return HealthResponse(
@@ -97,26 +149,17 @@ async def health_check():
 @app.post("/generate", response_model=GenerateResponse)
 async def generate_text(request: GenerateRequest):
     """Generate text using PubMedBERT."""
-    if text_generator is None:
+    if generation_config is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        # Generate text
-        results = text_generator(
+        # Generate text; only the continuation is decoded
+        generated_text = generate_continuation(
             request.prompt,
             max_length=request.max_length,
-            temperature=request.temperature,
-            do_sample=True,
-            num_return_sequences=1,
-            pad_token_id=tokenizer.eos_token_id
+            temperature=request.temperature
         )
         
-        generated_text = results[0]["generated_text"]
-        
-        # Remove the original prompt from the generated text
-        if generated_text.startswith(request.prompt):
-            generated_text = generated_text[len(request.prompt):].strip()
-        
         return GenerateResponse(
             generated_text=generated_text,
             confidence=0.8  # Placeholder confidence score
@@ -133,25 +176,109 @@ async def create_embeddings(request: EmbeddingRequest):
         raise HTTPException(status_code=503, detail="Embedding model not loaded")
     
     try:
-        # Create embeddings
-        embeddings = embedding_model.encode(
-            request.texts,
-            convert_to_numpy=True,
-            normalize_embeddings=True
-        )
+        future = asyncio.get_running_loop().create_future()
+        await _embedding_queue.put((request.texts, future))
         
-        return EmbeddingResponse(
-            embeddings=embeddings.tolist()
+        # Serialize the float32 array directly rather than building Python floats
+        # for EmbeddingResponse; a returned Response skips response_model validation
+        return Response(
+            content=orjson.dumps({"embeddings": await future}, option=orjson.OPT_SERIALIZE_NUMPY),
+            media_type="application/json"
         )
         
     except Exception as e:
         logger.error(f"Error creating embeddings: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """
+    Embed texts, reusing cached embeddings for texts seen recently.
+    
+    Only texts missing from the cache go through the model, in one encode call.
+    Returns a float32 array with one row per text.
+    """
+    missing = [text for text in dict.fromkeys(texts) if text not in _embedding_cache]
+    if missing:
+        encoded = embedding_model.encode(
+            missing,
+            batch_size=64,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        # Copy rows so a cached row does not keep its whole batch array alive
+        _embedding_cache.update((text, row.copy()) for text, row in zip(missing, encoded))
+    
+    embeddings = []
+    for text in texts:
+        _embedding_cache.move_to_end(text)
+        embeddings.append(_embedding_cache[text])
+    
+    # Evict least recently used entries only after the response is assembled
+    while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+    
+    if not embeddings:
+        return np.empty((0, embedding_model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return np.stack(embeddings)
+
+async def dispatch_embeddings(queue: "asyncio.Queue[Tuple[List[str], asyncio.Future]]"):
+    """
+    Serve queued embedding requests, merging those that arrive close together.
+    
+    After the first request of a batch arrives, waits EMBED_BATCH_WINDOW for
+    more, encodes all their texts in one call off the event loop, and hands
+    each request its slice.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        requests = [await queue.get()]
+        count = len(requests[0][0])
+        if count < EMBED_MAX_BATCH:
+            await asyncio.sleep(EMBED_BATCH_WINDOW)
+        while count < EMBED_MAX_BATCH and not queue.empty():
+            requests.append(queue.get_nowait())
+            count += len(requests[-1][0])
+        
+        texts = [text for request_texts, _ in requests for text in request_texts]
+        try:
+            embeddings = await loop.run_in_executor(None, encode_texts, texts)
+        except Exception as e:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        start = 0
+        for request_texts, future in requests:
+            end = start + len(request_texts)
+            # The client may have disconnected and cancelled its future
+            if not future.done():
+                future.set_result(embeddings[start:end])
+            start = end
+
+def generate_continuation(prompt: str, **generate_kwargs) -> str:
+    """
+    Generate a continuation of prompt and return only the new text.
+    
+    generate_kwargs override fields of the shared generation_config.
+    """
+    input_ids = tokenizer(prompt, add_special_tokens=False, return_tensors="pt").input_ids
+    attention_mask = torch.ones_like(input_ids)
+    
+    with torch.inference_mode():
+        output_ids = model.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            generation_config=generation_config,
+            **generate_kwargs
+        )
+    
+    return tokenizer.decode(output_ids[0, input_ids.shape[1]:], skip_special_tokens=True).strip()
+
 @app.post("/analyze_variant")
 async def analyze_variant(variant_data: Dict[str, Any]):
     """Analyze a genetic variant using PubMedBERT."""
-    if text_generator is None:
+    if generation_config is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
@@ -170,21 +297,12 @@ async def analyze_variant(variant_data: Dict[str, Any]):
         """
         
         # Generate analysis
-        results = text_generator(
+        analysis = generate_continuation(
             prompt,
             max_length=400,
-            temperature=0.3,  # Lower temperature for more focused analysis
-            do_sample=True,
-            num_return_sequences=1,
-            pad_token_id=tokenizer.eos_token_id
+            temperature=0.3  # Lower temperature for more focused analysis
         )
         
-        analysis = results[0]["generated_text"]
-        
-        # Clean up the response
-        if analysis.startswith(prompt):
-            analysis = analysis[len(prompt):].strip()
-        
         return {
             "variant": variant_data,
             "analysis": analysis,